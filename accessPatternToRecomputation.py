@@ -1,13 +1,82 @@
 #!/usr/bin/env python3
+import os
+import re
+import sys
+import mmap
+import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 
-# Load data from test/saved-results/access-pattern into array
-def load_file_into_array(filename):
-    with open(f"test/saved-results/access-pattern/{filename}", 'r') as file:
+from faest_test import BASE_VARIANTS
+
+FILEPATH = os.path.dirname(os.path.realpath(__file__))
+ACCESS_PATTERN_PATH = f"{FILEPATH}/test/saved-results/access-pattern"
+# Curves of the batch mode, the saved results are only read
+RECOMP_PATH = f"{FILEPATH}/test/results/recomp"
+
+# Trace folders used when no traces are given
+TRACE_FOLDERS = ["interleaved", "VBB-Prove", "vk_box", "final/embedded"]
+
+# l and lambda of every base variant
+PARAMETERS = {"128": (1600, 128),
+              "192": (3264, 192),
+              "256": (4000, 256),
+              "em128": (1280, 128),
+              "em192": (2304, 192),
+              "em256": (3584, 256)}
+assert sorted(PARAMETERS) == sorted(BASE_VARIANTS)
+
+MIN_OLES = 20
+
+# Parameters used for the saved curves in interleaved/recomp
+SAVED_CURVES = [("128-sign", 1600, 128),
+                ("192-sign", 3264, 192),
+                ("em128-sign", 1280, 128),
+                ("em192-sign", 2304, 192),
+                ("em256-sign", 3584, 256)]
+
+VARIANT_RE = re.compile(r"^(em)?(128|192|256)", re.IGNORECASE)
+
+# Binary traces written in trace mode (faest_test.py --trace), see
+# test/files/faest_trace.c for the format
+BINARY_TRACE_EXTENSION = ".trace"
+TRACE_MAGIC = b"FTRC"
+TRACE_HEADER_SIZE = 8
+TRACE_TYPECODES = {2: "H", 4: "I"}
+
+# Load binary trace from path into array, mapping the file instead of reading it
+def load_binary_trace(path):
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if mm[:len(TRACE_MAGIC)] != TRACE_MAGIC:
+            raise ValueError(f"{path} is not a binary access trace")
+        width = mm[len(TRACE_MAGIC)]
+        if width not in TRACE_TYPECODES:
+            raise ValueError(f"{path} has unsupported index width {width}")
+        view = memoryview(mm)[TRACE_HEADER_SIZE:]
+        try:
+            if sys.byteorder == "little":
+                return view.cast(TRACE_TYPECODES[width]).tolist()
+            data = array(TRACE_TYPECODES[width])
+            data.frombytes(view)
+            data.byteswap()
+            return data.tolist()
+        finally:
+            view.release()
+
+# Load trace from path into array
+def load_trace(path):
+    if path.endswith(BINARY_TRACE_EXTENSION):
+        return load_binary_trace(path)
+    with open(path, 'r') as file:
         data = file.readlines()
         #convert data to int
         data = [int(x.strip()) for x in data]
         return data
 
+# Load data from test/saved-results/access-pattern into array
+def load_file_into_array(filename):
+    return load_trace(f"{ACCESS_PATTERN_PATH}/{filename}")
+
 # find largest value in data
 def find_largest(data):
     largest = 0
@@ -32,34 +101,161 @@ def compute_recomputation(data, cache_size, largest, l):
                 start_idx = largest - cache_size
     return recomputation
 
+# Sparse tables with min and max of data[i:i + 2**k] at mins[k][i] and maxs[k][i]
+def build_range_tables(data):
+    mins = [list(data)]
+    maxs = [list(data)]
+    k = 1
+    while (1 << k) <= len(data):
+        half = 1 << (k - 1)
+        prev_min = mins[-1]
+        prev_max = maxs[-1]
+        count = len(data) - (1 << k) + 1
+        mins.append([min(prev_min[i], prev_min[i + half]) for i in range(count)])
+        maxs.append([max(prev_max[i], prev_max[i + half]) for i in range(count)])
+        k += 1
+    return mins, maxs
 
-# Main function
-if __name__ == '__main__':
-    # Load data from file
-    variant = "em256-sign"
-    min_oles = 20
-    #l = 1600  # 128
-    #l = 3264  # 192
-    #l = 4000  # 256
-    #l = 1280  # em128
-    #l = 2304  # em192
-    l = 3584  # em256
-    #lamb = 128
-    #lamb = 192
-    lamb = 256
-    data = load_file_into_array(f"interleaved/{variant}.txt")
+# First index from i where data is outside [low, high], or len(data) if none.
+# Jumps over whole blocks of hits, so this is O(log n)
+def next_miss(mins, maxs, i, low, high):
+    n = len(mins[0])
+    # Common case of back to back misses
+    if i < n and (mins[0][i] < low or mins[0][i] > high):
+        return i
+    for k in range(len(mins) - 1, -1, -1):
+        if i + (1 << k) <= n and mins[k][i] >= low and maxs[k][i] <= high:
+            i += 1 << k
+    return i
+
+# Same as compute_recomputation, but only visits the misses
+def compute_recomputation_tables(data, mins, maxs, cache_size, largest, l):
+    start_idx = 0
+
+    recomputation = 1
+    i = next_miss(mins, maxs, 0, start_idx, start_idx + cache_size)
+    while i < len(data):
+        recomputation += 1
+        if (data[i] > l):
+            start_idx = data[i] - cache_size
+        elif (data[i] + cache_size < largest):
+            start_idx = data[i]
+        else:
+            start_idx = largest - cache_size
+        i = next_miss(mins, maxs, i + 1, start_idx, start_idx + cache_size)
+    return recomputation
+
+# Number of recomputations for every cache size in cache_sizes
+def compute_recomputation_curve(data, cache_sizes, l):
     largest = find_largest(data)
-    # Go over all cache sizes from 19 to largest and store in an array
-    recomputation = []
-    # min_oles-1 since we go from amount to index
-    for i in range(min_oles-1, l + 2*lamb + 16):
-        recomputation.append(compute_recomputation(data, i, largest, l))
-
-    # Write recomputation to file
-    with open(f"test/saved-results/access-pattern/interleaved/recomp/comp-{variant}.txt", 'w') as file:
+    mins, maxs = build_range_tables(data)
+    return [compute_recomputation_tables(data, mins, maxs, c, largest, l) for c in cache_sizes]
+
+# Cache sizes of a curve, min_oles-1 since we go from amount to index
+def curve_cache_sizes(min_oles, l, lamb):
+    return range(min_oles - 1, l + 2*lamb + 16)
+
+def write_curve(filename, recomputation):
+    write_curve_to_path(f"{ACCESS_PATTERN_PATH}/{filename}", recomputation)
+
+def write_curve_to_path(path, recomputation):
+    with open(path, 'w') as file:
         #file.write(f"OLEs,comps\n")
         file.write(f"comps\n")
         for i in range(0, len(recomputation)):
             #file.write(f"{i + min_oles},{recomputation[i]}\n")
             file.write(f"{recomputation[i]}\n")
 
+def read_curve(filename):
+    with open(f"{ACCESS_PATTERN_PATH}/{filename}", 'r') as file:
+        lines = file.readlines()
+        assert lines[0].strip() == "comps"
+        return [int(x.strip()) for x in lines[1:]]
+
+# Regression check of the curve computation against the saved curves
+def check_saved_curves(min_oles=MIN_OLES):
+    success = True
+    for variant, l, lamb in SAVED_CURVES:
+        data = load_file_into_array(f"interleaved/{variant}.txt")
+        recomputation = compute_recomputation_curve(data, curve_cache_sizes(min_oles, l, lamb), l)
+        saved = read_curve(f"interleaved/recomp/comp-{variant}.txt")
+        if recomputation != saved:
+            print(f"{variant}: curve differs from saved result")
+            success = False
+        else:
+            print(f"{variant}: ok")
+    return success
+
+
+# Base variant of a trace from its file name, fx "em256-sign.txt" -> "em256"
+def trace_variant(path):
+    match = VARIANT_RE.match(os.path.basename(path))
+    if match is None:
+        raise ValueError(f"Cannot derive variant from trace name {path}")
+    return match.group(0).lower()
+
+def default_traces():
+    traces = []
+    for folder in TRACE_FOLDERS:
+        path = f"{ACCESS_PATTERN_PATH}/{folder}"
+        for element in sorted(os.listdir(path)):
+            if element.startswith("comp-") or not element.endswith((".txt", BINARY_TRACE_EXTENSION)):
+                continue
+            traces.append(os.path.join(path, element))
+    return traces
+
+# Curve is written to <out_dir>/<trace folder>/comp-<trace name>.txt
+def curve_path(trace, out_dir=RECOMP_PATH):
+    folder = os.path.dirname(os.path.abspath(trace))
+    out_dir = os.path.join(out_dir, os.path.basename(folder))
+    name = os.path.splitext(os.path.basename(trace))[0]
+    return os.path.join(out_dir, f"comp-{name}.txt")
+
+def sweep_trace(trace, out_path, min_oles=MIN_OLES):
+    l, lamb = PARAMETERS[trace_variant(trace)]
+    data = load_trace(trace)
+    recomputation = compute_recomputation_curve(data, curve_cache_sizes(min_oles, l, lamb), l)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    write_curve_to_path(out_path, recomputation)
+    return out_path
+
+# Sweep all traces in a process pool and write a curve per trace
+def sweep_all(traces, threads=1, out_dir=RECOMP_PATH, min_oles=MIN_OLES):
+    # Fail early on unknown variants
+    for trace in traces:
+        trace_variant(trace)
+
+    if threads <= 0:
+        threads = os.cpu_count()
+    outs = [curve_path(trace, out_dir) for trace in traces]
+    with ProcessPoolExecutor(max_workers=max(1, min(threads, len(traces)))) as executor:
+        futures = [executor.submit(sweep_trace, t, o, min_oles) for t, o in zip(traces, outs)]
+        for future in futures:
+            print(f"Wrote {future.result()}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compute recomputation curves from access traces.")
+
+    parser.add_argument("traces", nargs="*",
+                        help=f"Trace files, text or binary ({BINARY_TRACE_EXTENSION}). If empty, all traces in {TRACE_FOLDERS} are used")
+    parser.add_argument("-t", "--threads", type=int, default=1,
+                        help="Process count. Set to 0 for max utilization (default: 1)")
+    parser.add_argument("-o", "--out-dir", default=RECOMP_PATH,
+                        help=f"Output folder (default: {os.path.relpath(RECOMP_PATH)})")
+    parser.add_argument("--min-oles", type=int, default=MIN_OLES,
+                        help=f"Smallest cache size in OLEs (default: {MIN_OLES})")
+    parser.add_argument("--check", action="store_true", default=False,
+                        help="Check the curve computation against the saved interleaved curves")
+
+    return parser.parse_args()
+
+
+# Main function
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.check:
+        exit(0 if check_saved_curves() else 1)
+
+    traces = args.traces if args.traces else default_traces()
+    sweep_all(traces, args.threads, args.out_dir, args.min_oles)
@@ -3,7 +3,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 def f(l, l_hat, t, t2):
-    #k = l * (l_hat - l_hat/t2) - (l**2 + 2*l*t + l_hat*t)*(l_hat / t2)*t
+    k = l * (l_hat - l_hat/t2) - (l**2 + 2*l*t + l_hat*t)*(l_hat / t2)*t
     #k = 2**l *l_hat - 2**l * l_hat / t2 - l**2 * l_hat / t2 - 2 *l * l_hat * t / t2   - l_hat**2 * t / t2
     return k
 
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# This script compares two result folders (fx initial vs final) and reports
+# the change in instruction count (callgrind), peak memory (massif) and
+# cycles (perf) for every variant and operation found in both.
+import os
+import sys
+import argparse
+
+import parse_massif
+import parse_callgrind
+import parse_perf
+from parse_cache import ParseCache, parse_all
+
+TEST_NAMES = ['keygen', 'sign', 'verify']
+PREFIXES = ['perf_', 'massif_', 'callgrind_']
+
+
+def callgrind_metric(summary):
+    return summary['totals'][summary['events'].index('Ir')]
+
+
+def massif_metric(summary):
+    return summary['peak']
+
+
+def perf_metric(summary):
+    return int(summary['counters']['cycles']['value'])
+
+
+# tool: (metric name, summarize function, metric from summary)
+METRICS = {'callgrind': ('Ir', parse_callgrind.summarize_file, callgrind_metric),
+           'massif': ('Peak memory (B)', parse_massif.summarize_file, massif_metric),
+           'perf': ('Cycles', parse_perf.summarize_file, perf_metric)}
+
+
+def detect_tool(path):
+    with open(path, 'r', errors='replace') as f:
+        first = f.readline()
+        second = f.readline()
+    if first.startswith('# callgrind format'):
+        return 'callgrind'
+    if first.startswith('desc:') and second.startswith('cmd:'):
+        return 'massif'
+    if first.startswith('# started on'):
+        return 'perf'
+    return None
+
+
+# '128f_sign', 'perf_EM256s_verify' -> ('128f', 'sign')
+def split_result_name(filename):
+    name = os.path.basename(filename)
+    for prefix in PREFIXES:
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+    variant, _, operation = name.rpartition('_')
+    if not variant or operation not in TEST_NAMES:
+        return None
+    variant = variant[:-1].upper() + variant[-1]
+    return variant, operation
+
+
+# Find result files below dir_path, keyed by (tool, variant, operation)
+def find_results(dir_path):
+    results = {}
+    for root, dirs, files in os.walk(dir_path):
+        dirs.sort()
+        for element in sorted(files):
+            path = os.path.join(root, element)
+            name = split_result_name(path)
+            if name is None:
+                continue
+            tool = detect_tool(path)
+            if tool is None:
+                continue
+            key = (tool, *name)
+            if key in results:
+                print(f'Warning: {path} ignored, already using {results[key]}', file=sys.stderr)
+                continue
+            results[key] = path
+    return results
+
+
+def collect(dir_path, threads, cache):
+    results = find_results(dir_path)
+    values = {}
+    for tool, (_, summarize, metric) in METRICS.items():
+        keys = [k for k in results if k[0] == tool]
+        summaries = parse_all([results[k] for k in keys], summarize, threads, cache)
+        for k, s in zip(keys, summaries):
+            values[k] = metric(s)
+    return values
+
+
+def sort_key(key):
+    tool, variant, operation = key
+    return (list(METRICS).index(tool), variant[-1], variant[:-1], TEST_NAMES.index(operation))
+
+
+# Returns rows of (tool, variant, operation, before, after)
+def compare(before_path, after_path, threads=1, use_cache=True):
+    cache = ParseCache() if use_cache else None
+    before = collect(before_path, threads, cache)
+    after = collect(after_path, threads, cache)
+
+    rows = []
+    for key in sorted(before.keys() & after.keys(), key=sort_key):
+        rows.append((*key, before[key], after[key]))
+    return rows
+
+
+def relative_change(before, after):
+    if before == 0:
+        return 0.0 if after == 0 else float('inf')
+    return 100 * (after - before) / before
+
+
+def write_markdown_table(rows, wf):
+    wf.write('| Variant | Operation | Metric | Before | After | Change | Change % |\n')
+    wf.write('|:-------:|:---------:|:-------|-------:|------:|-------:|---------:|\n')
+    for tool, variant, operation, before, after in rows:
+        metric = METRICS[tool][0]
+        wf.write(f'| {variant} | {operation} | {metric} | {before:,} | {after:,} |'
+                 f' {after - before:+,} | {relative_change(before, after):+.2f}% |\n')
+
+
+# Returns the rows whose relative increase is above the threshold of their tool
+def regressions(rows, thresholds):
+    found = []
+    for row in rows:
+        tool, _, _, before, after = row
+        threshold = thresholds.get(tool)
+        if threshold is None:
+            continue
+        if relative_change(before, after) > threshold:
+            found.append(row)
+    return found
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compare instruction counts and peak memory of two result folders.')
+
+    parser.add_argument('before', help='Baseline result folder')
+    parser.add_argument('after', help='Result folder to compare against the baseline')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Write markdown table to file instead of stdout')
+    parser.add_argument('--threshold', type=float, default=None,
+                        help='Exit nonzero if any metric increases by more than this many percent')
+    parser.add_argument('--ir-threshold', type=float, default=None,
+                        help='Regression threshold for Ir in percent (overrides --threshold)')
+    parser.add_argument('--memory-threshold', type=float, default=None,
+                        help='Regression threshold for peak memory in percent (overrides --threshold)')
+    parser.add_argument('--cycles-threshold', type=float, default=None,
+                        help='Regression threshold for perf cycles in percent (overrides --threshold)')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='Process count. Set to 0 for max utilization (default: 1)')
+    parser.add_argument('--no-cache', action='store_true', default=False,
+                        help='Do not use the parse cache')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    rows = compare(args.before, args.after, args.threads, not args.no_cache)
+    if not rows:
+        print('No matching results found')
+        exit(1)
+
+    if args.output:
+        with open(args.output, 'w') as wf:
+            write_markdown_table(rows, wf)
+    else:
+        write_markdown_table(rows, sys.stdout)
+
+    thresholds = {tool: args.threshold for tool in METRICS}
+    if args.ir_threshold is not None:
+        thresholds['callgrind'] = args.ir_threshold
+    if args.memory_threshold is not None:
+        thresholds['massif'] = args.memory_threshold
+    if args.cycles_threshold is not None:
+        thresholds['perf'] = args.cycles_threshold
+
+    found = regressions(rows, thresholds)
+    for tool, variant, operation, before, after in found:
+        print(f'Regression: {variant} {operation} {METRICS[tool][0]} '
+              f'{relative_change(before, after):+.2f}%', file=sys.stderr)
+    if found:
+        exit(1)
+
+    exit(0)
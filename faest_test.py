@@ -6,8 +6,21 @@ import subprocess
 import argparse
 import shutil
 import time
+import hashlib
+import math
+import json
+import heapq
+import shlex
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from parse_massif import parse_and_write
+import parse_bench
+import parse_perf
+import parse_perf_record
+import parse_stack
+import parse_scaling
+import parse_throughput
+import results_store
 
 COMPILER = 'gcc'
 
@@ -17,23 +30,81 @@ SLOW_VARIANTS = [f'{v}s' for v in BASE_VARIANTS]
 VALID_VARIANTS = FAST_VARIANTS + SLOW_VARIANTS
 
 FILEPATH = os.path.dirname(os.path.realpath(__file__))
+FAEST_PATH = f'{FILEPATH}/faest'
+FAEST_BUILD_PATH = f'{FAEST_PATH}/build'
 TEST_BUILD_PATH = f'{FILEPATH}/test/build'
+TEST_BUILD_MATRIX_PATH = f'{TEST_BUILD_PATH}/matrix'
+TEST_BUILD_TRACE_PATH = f'{TEST_BUILD_PATH}/trace'
 TEST_RESULT_PATH = f'{FILEPATH}/test/results'
 TEST_RESULT_MASSIF_PATH = f'{TEST_RESULT_PATH}/massif'
 TEST_RESULT_CALLGRIND_PATH = f'{TEST_RESULT_PATH}/callgrind'
 TEST_RESULT_PERF_PATH = f'{TEST_RESULT_PATH}/perf'
+TEST_RESULT_PERF_RECORD_PATH = f'{TEST_RESULT_PATH}/perf-record'
+TEST_RESULT_BENCH_PATH = f'{TEST_RESULT_PATH}/bench'
+TEST_RESULT_SCALING_PATH = f'{TEST_RESULT_PATH}/scaling'
+TEST_RESULT_THROUGHPUT_PATH = f'{TEST_RESULT_PATH}/throughput'
+TEST_RESULT_MATRIX_PATH = f'{TEST_RESULT_PATH}/matrix'
+TEST_RESULT_TRACE_PATH = f'{TEST_RESULT_PATH}/trace'
+TEST_RESULT_STACK_PATH = f'{TEST_RESULT_PATH}/stack'
+# Outside the stack folder, so the massif check is not stored with the run
+TEST_RESULT_STACK_CHECK_PATH = f'{TEST_RESULT_PATH}/stack-check'
 TEST_FILE_PATH = f'{FILEPATH}/test/files'
+FAEST_HASH_FILE = f'{TEST_BUILD_PATH}/.faest.hash'
+DURATIONS_FILE = f'{FILEPATH}/test/.cache/durations.json'
+
+# Files in faest/ that affect the library build
+FAEST_SOURCE_EXTENSIONS = ('.c', '.h', '.build', '.options', 'meson_options.txt')
+FAEST_IGNORED_FOLDERS = ('build', '.git')
 
 # TEST_FILE_NAME = 'faest_test.c'
 TEST_KEYGEN_FILE_NAME = 'faest_test_keygen.c'
 TEST_SIGN_FILE_NAME = 'faest_test_sign.c'
 TEST_VERIFY_FILE_NAME = 'faest_test_verify.c'
+TEST_BENCH_FILE_NAME = 'faest_bench.c'
+TEST_TRACE_FILE_NAME = 'faest_trace.c'
+TEST_STACK_FILE_NAME = 'faest_stack.c'
 
 TEST_LIST = (('keygen', TEST_KEYGEN_FILE_NAME),
              ('sign', TEST_SIGN_FILE_NAME), ('verify', TEST_VERIFY_FILE_NAME))
 TEST_NAMES = list(name for (name, _) in TEST_LIST)
 
-TOOL_NAMES = ['massif', 'callgrind', 'perf']
+TOOL_NAMES = ['massif', 'callgrind', 'perf', 'perf-record']
+
+# Sampling frequency (Hz) of perf record, with DWARF unwinding as FAEST is
+# built without frame pointers
+PERF_RECORD_FREQUENCY = 10000
+
+# Default message length, same as MSG_LEN in faest_test.h
+MSG_LEN = 29
+
+# Message lengths of the scaling sweep, 0 B and 1 B to 1 MiB in steps of 4
+SCALING_MSG_LENS = [0] + [4 ** i for i in range(11)]
+
+# Adaptive repetition (--target-error): runs of the first round, and the
+# fewest runs of a later round
+ADAPTIVE_FIRST_ROUND = 10
+ADAPTIVE_MIN_ROUND = 5
+
+# Time budget of every job in adaptive mode in seconds
+TIME_BUDGET = 60
+
+# Keys and messages each throughput worker loops over
+CORPUS_SIZE = 16
+
+# Define that enables the access trace instrumentation of the VBB code, and
+# the flags of the trace build
+TRACE_DEFINE = 'FAEST_TRACE_ACCESS'
+TRACE_FLAGS = ['-O2', f'-D{TRACE_DEFINE}']
+# Hook of test/files/faest_trace.c the VBB code has to call
+TRACE_HOOK = 'faest_trace_access('
+
+# Build configurations of the matrix mode, tag: (C flags, OpenSSL)
+MATRIX_CONFIGS = {'O0': (['-O0'], True),
+                  'O1': (['-O1'], True),
+                  'O2': (['-O2'], True),
+                  'O3': (['-O3'], True),
+                  'O2-no-openssl': (['-O2'], False),
+                  'O3-native': (['-O3', '-march=native', '-mtune=native'], True)}
 
 
 # Append 'faest_' and insert '_' between 'em' and '128f'
@@ -48,6 +119,32 @@ def transform_variants(variants):
     return new
 
 
+# 'tag=flags' to (tag, C flags, OpenSSL), where the pseudo flag 'no-openssl'
+# disables OpenSSL. A preset tag alone selects its MATRIX_CONFIGS entry.
+def parse_config(spec):
+    tag, sep, flags = spec.partition('=')
+    if not sep:
+        if tag not in MATRIX_CONFIGS:
+            raise argparse.ArgumentTypeError(
+                f'{tag} is not a preset configuration. Only {list(MATRIX_CONFIGS)} may be used, or tag=flags')
+        return (tag, *MATRIX_CONFIGS[tag])
+    if not tag or '/' in tag:
+        raise argparse.ArgumentTypeError(f'{spec} does not have a valid tag')
+    flags = shlex.split(flags)
+    openssl = 'no-openssl' not in flags
+    return tag, [f for f in flags if f != 'no-openssl'], openssl
+
+
+# 1, 2, 4, ... and n itself
+def worker_counts(n):
+    counts = []
+    k = 1
+    while k < n:
+        counts.append(k)
+        k *= 2
+    return counts + [n]
+
+
 def parse_args():
     parser = argparse.ArgumentParser(description='FAEST memory profiler.')
 
@@ -60,11 +157,50 @@ def parse_args():
     parser.add_argument('-s', '--slow', action='store_true', default=False,
                         help='Include slow variants if variants argument is empty (default: False)')
     parser.add_argument('--tool', default=None,
-                        help='Select valgrind tool for profiling (massif or callgrind)')
+                        help='Select tool for profiling (massif, callgrind, perf or perf-record). perf-record may be'
+                        ' combined with --bench to sample more iterations')
     parser.add_argument('--no-openssl', action='store_true',
                         default=False, help='Disables OpenSSL optimization')
     parser.add_argument('--no-forced-rebuild', action='store_true',
-                        default=False, help='Disables forced ninja rebuild of FAEST')
+                        default=False, help='Never force a clean ninja rebuild of FAEST, even if its sources changed')
+    parser.add_argument('--force-rebuild', action='store_true',
+                        default=False, help='Always force a clean ninja rebuild of FAEST and recompile all tests')
+    parser.add_argument('--bench', action='store_true', default=False,
+                        help='Run the in-process benchmark harness instead of the tests')
+    parser.add_argument('--iterations', type=int, default=100,
+                        help='Timed iterations per operation in benchmark mode, and runs with --tool perf (default: 100)')
+    parser.add_argument('--warmup', type=int, default=10,
+                        help='Untimed iterations before timing in benchmark mode (default: 10)')
+    parser.add_argument('--msg-len', type=int, default=MSG_LEN,
+                        help=f'Message length in bytes in benchmark mode (default: {MSG_LEN})')
+    parser.add_argument('--target-error', type=float, default=None,
+                        help='Instead of a fixed count, repeat until the 95%% confidence interval of the median (benchmark'
+                        ' mode) or mean (--tool perf) is within this relative error, fx 0.01')
+    parser.add_argument('--time-budget', type=float, default=TIME_BUDGET,
+                        help=f'Seconds after which a job stops repeating with --target-error (default: {TIME_BUDGET})')
+    parser.add_argument('--scaling', action='store_true', default=False,
+                        help='Sweep the message length with the benchmark harness, and massif if installed')
+    parser.add_argument('--msg-lens', type=int, nargs='+', default=SCALING_MSG_LENS,
+                        help='Message lengths in bytes of the scaling sweep (default: 0 and 1 B to 1 MiB, log scale)')
+    parser.add_argument('--throughput', action='store_true', default=False,
+                        help='Measure aggregate ops/s of concurrent harness workers per variant and operation')
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help='Worker counts in throughput mode (default: powers of two up to the CPU count)')
+    parser.add_argument('--corpus', type=int, default=CORPUS_SIZE,
+                        help=f'Keys and messages per worker in throughput mode (default: {CORPUS_SIZE})')
+    parser.add_argument('--matrix', nargs='*', default=None, metavar='CONFIG',
+                        help=f'Build every configuration out-of-tree and run all of them. A configuration is a preset'
+                        f' ({", ".join(MATRIX_CONFIGS)}) or tag=flags, fx \'O2-m4=-O2 -mtune=cortex-m4\','
+                        f' where the flag no-openssl disables OpenSSL (default: all presets)')
+    parser.add_argument('--stack', action='store_true', default=False,
+                        help='Measure the peak stack of every test with a painted thread stack instead of massif')
+    parser.add_argument('--stack-check', nargs='*', default=None, metavar='VARIANT',
+                        help='Variants whose painted peak stack is checked against massif in stack mode, if valgrind'
+                        ' is installed. Empty to skip the check (default: the first variant)')
+    parser.add_argument('--trace', action='store_true', default=False,
+                        help=f'Build FAEST out-of-tree with -D{TRACE_DEFINE}, record the OLE/VOLE accesses of sign and'
+                        ' verify as binary traces and compute their recomputation curves. Only available if the VBB'
+                        ' code of the faest tree calls faest_trace_access()')
     parser.add_argument('-v', '--verbose', action='store_true',
                         default=False, help='Be verbose')
 
@@ -99,11 +235,62 @@ def parse_args():
         raise argparse.ArgumentTypeError(
             f'{t} is not a valid tool. Only {TOOL_NAMES} may be used')
 
+    if (args.scaling or args.throughput) and args.tool:
+        raise argparse.ArgumentTypeError('--scaling and --throughput can not be combined with --tool')
+    if args.bench and args.tool and args.tool != 'perf-record':
+        raise argparse.ArgumentTypeError('--bench can only be combined with --tool perf-record')
+    if args.scaling and args.throughput:
+        raise argparse.ArgumentTypeError('--scaling can not be combined with --throughput')
+
+    if args.matrix is not None and (args.no_openssl or args.scaling or args.throughput):
+        raise argparse.ArgumentTypeError('--matrix can not be combined with --no-openssl, --scaling or --throughput')
+
+    if args.target_error is not None:
+        if args.target_error <= 0:
+            raise argparse.ArgumentTypeError('--target-error must be positive')
+        if not (args.bench or args.scaling or args.tool == 'perf') or args.throughput or args.tool not in (None, 'perf'):
+            raise argparse.ArgumentTypeError('--target-error requires --bench, --scaling or --tool perf')
+
+    if args.stack and (args.tool or args.bench or args.scaling or args.throughput or args.trace):
+        raise argparse.ArgumentTypeError('--stack can not be combined with --tool, --bench, --scaling,'
+                                         ' --throughput or --trace')
+    if args.stack_check is not None and not args.stack:
+        raise argparse.ArgumentTypeError('--stack-check requires --stack')
+
+    # Variants checked against massif
+    stack_check = []
+    if args.stack:
+        stack_check = variants[:1] if args.stack_check is None else transform_variants(args.stack_check)
+        for v in stack_check:
+            if v not in variants:
+                raise argparse.ArgumentTypeError(f'{v} of --stack-check is not a selected variant')
+
+    if args.trace and not trace_hook_available():
+        raise argparse.ArgumentTypeError(f'--trace is unavailable, no FAEST source calls {TRACE_HOOK[:-1]}()'
+                                         f' under {TRACE_DEFINE}')
+    if args.trace and (args.tool or args.bench or args.scaling or args.throughput or args.matrix is not None):
+        raise argparse.ArgumentTypeError('--trace can not be combined with --tool, --bench, --scaling,'
+                                         ' --throughput or --matrix')
+
+    # Configurations
+    matrix = None
+    if args.matrix is not None:
+        matrix = [parse_config(c) for c in args.matrix or MATRIX_CONFIGS]
+        tags = [tag for tag, _, _ in matrix]
+        if len(set(tags)) != len(tags):
+            raise argparse.ArgumentTypeError(f'Configuration tags must be unique, got {tags}')
+
+    # Workers
+    workers = args.workers or worker_counts(os.cpu_count())
+    if min(workers) <= 0:
+        raise argparse.ArgumentTypeError('--workers must be positive')
+
     # Threads
     threads = args.threads
     if threads <= 0:
         threads = os.cpu_count()
-    threads = min(threads, len(variants))
+    # At most one compile or run job per variant, test program and configuration
+    threads = min(threads, len(variants) * len(tests) * (len(matrix) if matrix else 1))
 
     return {'threads': threads,
             'variants': variants,
@@ -111,7 +298,28 @@ def parse_args():
             'tool': args.tool,
             'verbose': args.verbose,
             'no-openssl': args.no_openssl,
-            'no-forced-rebuild': args.no_forced_rebuild}
+            'no-forced-rebuild': args.no_forced_rebuild,
+            'force-rebuild': args.force_rebuild,
+            'bench': args.bench or args.scaling or args.throughput,
+            'iterations': args.iterations,
+            'target-error': args.target_error,
+            'time-budget': args.time_budget,
+            'warmup': args.warmup,
+            'msg-len': args.msg_len,
+            'scaling': args.scaling,
+            'msg-lens': sorted(set(args.msg_lens)),
+            'throughput': args.throughput,
+            'workers': sorted(set(workers)),
+            'corpus': args.corpus,
+            'matrix': matrix,
+            'trace': args.trace,
+            'stack': args.stack,
+            'stack-check': stack_check,
+            'tag': None,
+            'faest-path': FAEST_PATH,
+            'lib-path': FAEST_BUILD_PATH,
+            'build-path': TEST_BUILD_PATH,
+            'result-path': TEST_RESULT_PATH}
 
 
 # Compiles the reference implementation
@@ -126,17 +334,79 @@ def compile_faest(verbose=False):
         exit(1)
 
 
+# Content hash of files (and extra strings like compiler flags)
+def hash_files(paths, extra=()):
+    h = hashlib.sha256()
+    for e in extra:
+        h.update(e.encode())
+        h.update(b'\0')
+    for path in paths:
+        h.update(path.encode())
+        h.update(b'\0')
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def read_hash(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def write_hash(path, digest):
+    ensure_folder(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(digest)
+
+
+def faest_sources():
+    paths = []
+    for root, dirs, files in os.walk(f'{FILEPATH}/faest'):
+        dirs[:] = sorted(d for d in dirs if d not in FAEST_IGNORED_FOLDERS)
+        for file in sorted(files):
+            if file.endswith(FAEST_SOURCE_EXTENSIONS):
+                paths.append(os.path.join(root, file))
+    return paths
+
+
+# Whether the library sources call the trace hook, without it nothing is traced
+def trace_hook_available():
+    for path in faest_sources():
+        if path.endswith(('.c', '.h')):
+            with open(path, 'r', errors='replace') as f:
+                if TRACE_HOOK in f.read():
+                    return True
+    return False
+
+
+# Hash of the library sources, including the current OpenSSL setting in meson.build
+def faest_hash():
+    return hash_files(faest_sources())
+
+
 def ensure_folder(path):
     os.makedirs(path, exist_ok=True)
 
 
+# Result folder of a tool (or 'bench') for the current run
+def result_folder(args, kind):
+    return f'{args["result-path"]}/{kind}'
+
+
+# Scaling and throughput create their folders per message length and worker
+# count, so only the folder of the mode that is running is created
 def ensure_result_folder(args):
-    if args['tool'] == 'massif':
-        ensure_folder(TEST_RESULT_MASSIF_PATH)
-    if args['tool'] == 'callgrind':
-        ensure_folder(TEST_RESULT_CALLGRIND_PATH)
-    if args['tool'] == 'perf':
-        ensure_folder(TEST_RESULT_PERF_PATH)
+    if args['tool']:
+        ensure_folder(result_folder(args, args['tool']))
+    if args['bench'] and not (args['tool'] or args['scaling'] or args['throughput']):
+        ensure_folder(result_folder(args, 'bench'))
+    if args['trace']:
+        ensure_folder(result_folder(args, 'trace'))
+    if args['stack'] and not args['tool']:
+        ensure_folder(result_folder(args, 'stack'))
 
 
 def copy(src, dst):
@@ -148,35 +418,67 @@ def copy(src, dst):
 
 
 # Copy files needed for given variants to build folders
-def copy_files(variant):
-    files = [('faest/', 'faest_defines.h'),
-             (f'test/files/', 'faest_test.h'),
-             ('faest/build/', f'{variant}.h'),
-             (f'faest/build/{variant}/', 'api.h'),
-             (f'faest/build/{variant}/', 'crypto_sign.h'),
-             (f'faest/build/{variant}/', 'crypto_sign.c')]
+def copy_files(variant, args):
+    faest = args['faest-path']
+    lib = args['lib-path']
+    files = [(f'{faest}/', 'faest_defines.h'),
+             (f'{TEST_FILE_PATH}/', 'faest_test.h'),
+             (f'{lib}/', f'{variant}.h'),
+             (f'{lib}/{variant}/', 'api.h'),
+             (f'{lib}/{variant}/', 'crypto_sign.h'),
+             (f'{lib}/{variant}/', 'crypto_sign.c')]
+    # Shared by all test programs of the variant, so copied once before they
+    # are compiled in parallel
+    if args['trace']:
+        files.append((f'{TEST_FILE_PATH}/', TEST_TRACE_FILE_NAME))
     for path, file in files:
-        copy(f'{FILEPATH}/{path}{file}', f'{TEST_BUILD_PATH}/{variant}/{file}')
-
-
-def compile(variant, program, name, verbose):
-    copy(f'{TEST_FILE_PATH}/{program}',
-         f'{TEST_BUILD_PATH}/{variant}/{program}')
-
-    link_path = f'{FILEPATH}/faest/build'
-
-    cmd = [COMPILER, f'-L{link_path}', '-lfaest', '-o',
-           name, 'crypto_sign.c', program]
-    cwd = f'{TEST_BUILD_PATH}/{variant}'
-    if verbose:
-        process = subprocess.Popen(cmd, cwd=cwd, text=True)
-    else:
-        process = subprocess.Popen(
-            cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, text=True)
-    code = process.wait()
-    if code != 0:  # TODO
-        print(f'error compiling: {name} with {variant}')
-        exit(1)
+        copy(f'{path}{file}', f'{args["build-path"]}/{variant}/{file}')
+
+
+# Files in the variant build folder that a test binary is compiled from
+def compile_inputs(variant, programs, build_path):
+    files = [*programs, 'faest_test.h', 'faest_defines.h', f'{variant}.h',
+             'api.h', 'crypto_sign.h', 'crypto_sign.c']
+    return [f'{build_path}/{variant}/{f}' for f in files]
+
+
+# Returns None on success, otherwise the compiler output. library_hash is the
+# hash of the library sources, so binaries are also rebuilt when they change.
+# libfaest is linked as a shared library, so this is not needed for a
+# correct binary, but keeps it from being skipped if that ever changes.
+def compile(variant, program, name, args, library_hash=''):
+    verbose = args['verbose']
+    cwd = f'{args["build-path"]}/{variant}'
+    copy(f'{TEST_FILE_PATH}/{program}', f'{cwd}/{program}')
+    programs = [program]
+    # The library calls back into the trace writer (see copy_files), so
+    # export its symbols
+    if args['trace']:
+        programs.append(TEST_TRACE_FILE_NAME)
+
+    cmd = [COMPILER, f'-L{args["lib-path"]}', '-lfaest', '-o',
+           name, 'crypto_sign.c', *programs]
+    if args['trace']:
+        cmd.append('-rdynamic')
+    if program == TEST_STACK_FILE_NAME:
+        cmd.append('-pthread')
+
+    # Skip if neither the inputs nor the command changed since last compile
+    hash_path = f'{cwd}/.{name}.hash'
+    digest = hash_files(compile_inputs(variant, programs, args['build-path']), [library_hash, *cmd])
+    if not args['force-rebuild'] and read_hash(hash_path) == digest and os.path.isfile(f'{cwd}/{name}'):
+        if verbose:
+            print(f'{name} with {variant} is up to date')
+        return None
+
+    process = subprocess.run(cmd, cwd=cwd, stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT, text=True)
+    if verbose and process.stdout:
+        print(process.stdout, end='')
+    if process.returncode != 0:
+        return process.stdout
+    write_hash(hash_path, digest)
+    return None
 
 
 def simplify_name(name):
@@ -187,94 +489,633 @@ def simplify_name(name):
     return name
 
 
-def tool_cmd(variant, name, args):
+def perf_path(variant, name, args):
+    return f'{result_folder(args, "perf")}/perf_{simplify_name(variant)}_{name}'
+
+
+def bench_path(variant, name, args):
+    return f'{result_folder(args, "bench")}/bench_{simplify_name(variant)}_{name}'
+
+
+# With append, results are added to those of the previous round
+def tool_cmd(variant, name, args, append=False):
     if args['tool'] == 'massif':
         return ['valgrind', '--tool=massif', '--stacks=yes', '--threshold=0.01',
                 '--peak-inaccuracy=0.1', '--time-unit=B', '--detailed-freq=1', '--max-snapshots=1000',
-                f'--massif-out-file={TEST_RESULT_MASSIF_PATH}/{simplify_name(variant)}_{name}']
+                f'--massif-out-file={result_folder(args, "massif")}/{simplify_name(variant)}_{name}']
 
     if args['tool'] == 'callgrind':
-        return ['valgrind', '--tool=callgrind', f'--callgrind-out-file={TEST_RESULT_CALLGRIND_PATH}/{simplify_name(variant)}_{name}']
+        return ['valgrind', '--tool=callgrind', f'--callgrind-out-file={result_folder(args, "callgrind")}/{simplify_name(variant)}_{name}']
 
     if args['tool'] == 'perf':
-        return ['perf', 'stat', '--detailed', '-r 100', '-o', f'{TEST_RESULT_PERF_PATH}/perf_{simplify_name(variant)}_{name}']
+        return ['perf', 'stat', '--detailed', f'-r {args["iterations"]}', '-o', perf_path(variant, name, args)] + \
+            (['--append'] if append else [])
+
+    if args['tool'] == 'perf-record':
+        return ['perf', 'record', '--quiet', '-F', str(PERF_RECORD_FREQUENCY), '--call-graph', 'dwarf',
+                '-o', f'{result_folder(args, "perf-record")}/{simplify_name(variant)}_{name}.data', '--']
 
     return []
 
 
-def start_process(variant, name, args):
-    cmd = tool_cmd(variant, name, args)
+def program_cmd(variant, name, args):
+    if args['bench']:
+        return [f'{args["build-path"]}/{variant}/bench', name, str(args['iterations']),
+                str(args['warmup']), str(args['msg-len'])]
+    if args['stack']:
+        # Without painting when profiled
+        return [f'{args["build-path"]}/{variant}/stack', name] + (['plain'] if args['tool'] else [])
+    return [f'{args["build-path"]}/{variant}/{name}']
 
-    cmd += [f'{TEST_BUILD_PATH}/{variant}/{name}']
 
+def library_env(args):
     env = os.environ.copy()
     # Linux dynamic lib path
-    env['LD_LIBRARY_PATH'] = f'{FILEPATH}/faest/build'
+    env['LD_LIBRARY_PATH'] = args['lib-path']
     # MacOS dynamic lib path
-    env['DYLD_LIBRARY_PATH'] = f'{FILEPATH}/faest/build'
-
-    return subprocess.Popen(cmd, cwd=f'{TEST_BUILD_PATH}/{variant}', stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, text=True)
-
-
-def run_all(args, name):
-    remaining = args['variants'].copy()
-    threads = []
+    env['DYLD_LIBRARY_PATH'] = args['lib-path']
+    return env
+
+
+def start_process(variant, name, args, append=False):
+    cmd = tool_cmd(variant, name, args, append)
+
+    cmd += program_cmd(variant, name, args)
+    env = library_env(args)
+    cwd = f'{args["build-path"]}/{variant}'
+    if args['trace']:
+        env['FAEST_TRACE_FILE'] = f'{result_folder(args, "trace")}/{simplify_name(variant)}_{name}.trace'
+
+    # The stack harness prints the peak stack
+    if args['stack'] and not args['tool']:
+        with open(f'{result_folder(args, "stack")}/stack_{simplify_name(variant)}_{name}', 'w') as out:
+            return subprocess.Popen(cmd, cwd=cwd, stdout=out, stderr=subprocess.DEVNULL, env=env, text=True)
+
+    # Only plain harness runs keep the output
+    if not args['bench'] or args['tool']:
+        return subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, text=True)
+
+    # The harness prints the timing of every iteration
+    with open(bench_path(variant, name, args), 'a' if append else 'w') as out:
+        return subprocess.Popen(cmd, cwd=cwd, stdout=out, stderr=subprocess.DEVNULL, env=env, text=True)
+
+
+# Wall time of previous runs, used to start the longest jobs first
+def load_durations():
+    try:
+        with open(DURATIONS_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_durations(durations):
+    ensure_folder(os.path.dirname(DURATIONS_FILE))
+    with open(DURATIONS_FILE, 'w') as f:
+        json.dump(durations, f, indent=1, sort_keys=True)
+
+
+def duration_key(variant, name, args):
+    mode = args['tool'] or 'native'
+    if args['bench']:
+        mode = f'bench-{mode}/{args["msg-len"]}'
+    if args['stack']:
+        mode = f'stack-{mode}'
+    if adaptive(args):
+        mode = f'{mode}/adaptive'
+    if args['tag']:
+        mode = f'{mode}/{args["tag"]}'
+    return f'{mode}/{variant}/{name}'
+
+
+# Estimated wall time in seconds of a job. Previous durations are used if
+# known, otherwise a rough guess where slow variants and higher security
+# levels take longer and valgrind tools are much slower than native runs.
+def estimate_duration(variant, name, args, durations):
+    known = durations.get(duration_key(variant, name, args))
+    if known is not None:
+        return known
+    level = int(''.join(c for c in variant if c.isdigit()))
+    estimate = level / 128 * (0.01 if name == 'keygen' else 0.1)
+    if variant.endswith('s'):
+        estimate *= 5
+    if args['tool'] in ('massif', 'callgrind'):
+        estimate *= 50
+    if args['bench']:
+        estimate *= args['iterations'] + args['warmup']
+    return estimate
+
+
+def adaptive(args):
+    return args['target-error'] is not None and (args['tool'] == 'perf' or (args['bench'] and not args['tool']))
+
+
+# Relative half width of the 95% confidence interval of the results so far
+# (None if unknown) and the number of runs
+def result_precision(variant, name, args):
+    if args['tool'] == 'perf':
+        s = parse_perf.summarize_file(perf_path(variant, name, args))
+        ci = parse_perf.confidence_interval(s['elapsed_stddev'], s['runs'])
+        if not s['elapsed'] or not math.isfinite(ci):
+            return None, s['runs']
+        return ci / s['elapsed'], s['runs']
+    s = parse_bench.summarize_file(bench_path(variant, name, args))
+    return s['median_rel_ci'], s['iterations']
+
+
+# Repeat in rounds until the confidence interval is within the target error
+# or the time budget is spent. After the first round, the next one has as
+# many runs as the spread so far says are missing (the interval shrinks with
+# the square root of the runs), limited by the remaining budget.
+def run_adaptive(variant, name, args):
+    start = time.monotonic()
+    runs = ADAPTIVE_FIRST_ROUND
+    append = False
+    while True:
+        code = start_process(variant, name, dict(args, iterations=runs), append).wait()
+        if code != 0:
+            return code
+        append = True
+
+        precision, total = result_precision(variant, name, args)
+        if precision is not None and precision <= args['target-error']:
+            return 0
+
+        spent = time.monotonic() - start
+        per_run = spent / max(total, 1)
+        affordable = int((args['time-budget'] - spent) / per_run)
+        if affordable < ADAPTIVE_MIN_ROUND:
+            return 0
+        missing = total * ((precision / args['target-error']) ** 2 - 1) if precision is not None else total
+        runs = min(max(math.ceil(missing), ADAPTIVE_MIN_ROUND), affordable)
+
+
+def run_process(variant, name, args):
+    start = time.monotonic()
+    if adaptive(args):
+        code = run_adaptive(variant, name, args)
+    else:
+        code = start_process(variant, name, args).wait()
+    return code, time.monotonic() - start
+
+
+def job_name(job):
+    tag, variant, name = job
+    if tag:
+        return f'{tag} {simplify_name(variant)} {name}'
+    return f'{simplify_name(variant)} {name}'
+
+
+def print_progress(done, running, waiting):
+    print('\r\033[K\033[96mDone:\033[0m {}, \033[96mRunning:\033[0m {}, \033[96mWaiting:\033[0m {}'.format(
+        len(done),
+        [job_name(j) for j in running],
+        waiting), end='')
+
+
+# Tests of a variant depend on the previous selected test of that variant
+# (keys and signature are passed through files), so each variant is a chain
+# keygen -> sign -> verify. All chains share the worker pool, and ready jobs
+# are started by longest remaining chain first. configs maps the tag of a
+# build configuration to its args, by default only args itself is run.
+def run_all(args, tests, configs=None):
+    if configs is None:
+        configs = {args['tag']: args}
+    durations = load_durations()
+    order = [name for name, _ in TEST_LIST if name in tests]
+
+    jobs = [(tag, v, name) for tag in configs for v in args['variants'] for name in order]
+    successor = {}
+    waiting_on = {}
+    for tag in configs:
+        for v in args['variants']:
+            for prev, name in zip(order, order[1:]):
+                successor[(tag, v, prev)] = (tag, v, name)
+                waiting_on[(tag, v, name)] = (tag, v, prev)
+
+    # Remaining chain length from each job
+    chain = {}
+    for job in reversed(jobs):
+        tag, v, name = job
+        after = chain.get(successor.get(job), 0)
+        chain[job] = estimate_duration(v, name, configs[tag], durations) + after
+
+    ready = [(-chain[j], j) for j in jobs if j not in waiting_on]
+    heapq.heapify(ready)
+    running = {}
     done = []
-
-    # Keep specified amount of threads bussy
-    while len(remaining) > 0 or len(threads) > 0:
-        while len(remaining) > 0 and args['threads'] > len(threads):
-            variant = remaining.pop()
-            threads.append(
-                (variant, start_process(variant, name, args)))
-
-        # Print progress
-        print('\r\033[96mDone:\033[0m {}, \033[96mRunning:\033[0m {}, \033[96mWaiting:\033[0m {}   '.format(
-            [simplify_name(x[0]) for x in done],
-            [simplify_name(x[0]) for x in threads],
-            [simplify_name(x) for x in remaining]), end='')
-
-        # Remove if done
-        flag_done = []
-        while not flag_done:
-            flag_done = [v for v, p in threads if not p.poll() == None]
-            # Avoid too busy waiting
-            time.sleep(0.1)
-
-        done += [(v, p.returncode) for v, p in threads if v in flag_done]
-        threads = [(v, p) for v, p in threads if v not in flag_done]
-
-    # Print progress
-    print('\r\033[96mDone:\033[0m {}, \033[96mRunning:\033[0m {}, \033[96mWaiting:\033[0m {}   '.format(
-        [simplify_name(x[0]) for x in done],
-        [simplify_name(x[0]) for x in threads],
-        [simplify_name(x) for x in remaining]), end='')
+    failed = []
+    skipped = []
+
+    with ThreadPoolExecutor(max_workers=args['threads']) as executor:
+        while ready or running:
+            while ready and len(running) < args['threads']:
+                _, job = heapq.heappop(ready)
+                tag, v, name = job
+                running[executor.submit(run_process, v, name, configs[tag])] = job
+
+            print_progress(done, list(running.values()),
+                           len(jobs) - len(done) - len(running) - len(failed) - len(skipped))
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for f in finished:
+                job = running.pop(f)
+                code, duration = f.result()
+                nxt = successor.get(job)
+                if code != 0:
+                    failed.append((job, code))
+                    # Later tests of the variant can not run
+                    while nxt is not None:
+                        skipped.append(nxt)
+                        nxt = successor.get(nxt)
+                    continue
+                done.append(job)
+                tag, v, name = job
+                durations[duration_key(v, name, configs[tag])] = duration
+                if nxt is not None:
+                    heapq.heappush(ready, (-chain[nxt], nxt))
+
+    print_progress(done, [], 0)
 
     # Newline
     print('')
+    save_durations(durations)
 
     # Check return codes
-    success = True
-    for v, c in done:
-        if c != 0:
-            print(f'{v} returned \'{c}\'')
-            success = False
+    for (tag, v, name), code in failed:
+        print(f'{name} with {v}{f" ({tag})" if tag else ""} returned \'{code}\'')
+    for tag, v, name in skipped:
+        print(f'{name} with {v}{f" ({tag})" if tag else ""} skipped')
 
-    if not success:
+    if failed:
         exit(1)
 
 
-def copy_all(args):
+# Run the harness at every message length of the sweep, each length in its
+# own result folder. Peak heap and stack come from a single iteration under
+# massif, if valgrind is installed. keygen does not depend on the message.
+def run_scaling(args, tests):
+    tests = [t for t in tests if t != 'keygen']
+    memory = shutil.which('valgrind') is not None
+    if not memory:
+        print('valgrind not found, skipping peak memory')
+
+    for msg_len in args['msg-lens']:
+        # Every pass is a plain bench (or massif) run in the folder of the message length
+        timing = dict(args, **{'msg-len': msg_len,
+                               'scaling': False,
+                               'result-path': f'{TEST_RESULT_SCALING_PATH}/msg-{msg_len}'})
+        passes = [timing]
+        if memory:
+            passes.append(dict(timing, tool='massif', iterations=1, warmup=0))
+
+        for a in passes:
+            print(f'Message length {msg_len} B{" (massif)" if a["tool"] else ""}')
+            ensure_result_folder(a)
+            run_all(a, tests)
+
+
+# Start `workers` harness processes in corpus mode and release them together
+# once all have generated their corpus. Returns the 'start end ops' line of
+# every worker, or None if one of them failed.
+def run_workers(variant, name, workers, args):
+    cmd = program_cmd(variant, name, args) + [str(args['corpus'])]
+    processes = [subprocess.Popen(cmd, cwd=f'{args["build-path"]}/{variant}', stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=library_env(args), text=True)
+                 for _ in range(workers)]
+
+    ready = [p.stdout.readline().strip() == 'ready' for p in processes]
+    for p in processes:
+        try:
+            p.stdin.write('\n')
+            p.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    lines = [p.stdout.read().strip() for p in processes]
+    codes = [p.wait() for p in processes]
+    if not all(ready) or any(codes):
+        return None
+    return lines
+
+
+# Run every variant and test with each worker count, one configuration at a
+# time so that the workers have the machine to themselves
+def run_throughput(args, tests):
+    folder = result_folder(args, 'throughput')
+    ensure_folder(folder)
+    failed = []
     for v in args['variants']:
-        copy_files(v)
+        for name in tests:
+            for workers in args['workers']:
+                print(f'{simplify_name(v)} {name}: {workers} worker(s)')
+                lines = run_workers(v, name, workers, args)
+                if lines is None:
+                    failed.append((v, name, workers))
+                    continue
+                with open(f'{folder}/throughput_{simplify_name(v)}_{name}_{workers}', 'w') as f:
+                    f.write('\n'.join(lines) + '\n')
+
+    for v, name, workers in failed:
+        print(f'{name} with {v} failed with {workers} worker(s)')
+    if failed:
+        exit(1)
+
+
+# Run the stack harness without painting under massif for the check variants
+# of every configuration (see run_all). The massif files are written next to
+# the stack folder, so they are not stored with the run.
+def run_stack_check(args, tests, configs=None):
+    if not args['stack-check']:
+        return
+    if shutil.which('valgrind') is None:
+        print('valgrind not found, skipping the massif check')
+        return
+
+    if configs is None:
+        configs = {args['tag']: args}
+    check = {'variants': args['stack-check'], 'tool': 'massif'}
+    checks = {tag: dict(config, **check, **{'result-path': result_folder(config, 'stack-check')})
+              for tag, config in configs.items()}
+    for config in checks.values():
+        ensure_result_folder(config)
+    print(f'Checking {[simplify_name(v) for v in args["stack-check"]]} against massif')
+    run_all(dict(args, **check), tests, checks)
+
+
+# Table of the painted peak stack of a configuration next to massif
+def write_stack_table(config):
+    outpath = f'{config["result-path"]}/stack.md'
+    mismatches = parse_stack.parse_and_write(result_folder(config, 'stack'),
+                                             f'{result_folder(config, "stack-check")}/massif', outpath)
+    print(f'Wrote {outpath}')
+    tag = f' ({config["tag"]})' if config['tag'] else ''
+    for variant, operation in mismatches:
+        print(f'{variant} {operation}{tag} differs from massif by more than {parse_stack.CHECK_TOLERANCE} B')
+
+
+# Folded stacks and flame graphs next to the perf record data
+def fold_perf_record(dir_path, threads):
+    print(f'Folding perf record stacks in {dir_path}')
+    failed = parse_perf_record.fold_folder(dir_path, threads)
+    for path, error in failed:
+        print(f'perf script failed on {path}')
+        print(error, end='')
+
+
+def run_mode(args):
+    if args['tool']:
+        return args['tool']
+    for mode in ('scaling', 'throughput', 'bench', 'stack'):
+        if args[mode]:
+            return mode
+    return 'native'
+
+
+def mode_result_path(mode):
+    paths = {'scaling': TEST_RESULT_SCALING_PATH,
+             'throughput': TEST_RESULT_THROUGHPUT_PATH,
+             'bench': TEST_RESULT_BENCH_PATH,
+             'stack': TEST_RESULT_STACK_PATH}
+    return paths.get(mode, f'{TEST_RESULT_PATH}/{mode}')
+
+
+# Build configuration and environment of a run, for the results store
+def run_metadata(args, mode):
+    options = results_store.meson_options(args['lib-path'])
+    commit = results_store.git_commit(FAEST_PATH) or results_store.git_commit(FILEPATH)
+    return {'label': args['tag'],
+            'mode': mode,
+            'commit_hash': commit,
+            'host': results_store.host_info(),
+            'compiler': results_store.compiler_version(COMPILER),
+            'compiler_flags': results_store.meson_flags(options),
+            'openssl': 0 if args['no-openssl'] else 1,
+            'build_config': options,
+            'args': args}
+
+
+# Copy the FAEST sources to dst with OpenSSL switched in meson.build. Only
+# files whose content changed are written, so ninja keeps unchanged objects.
+def stage_faest(dst, openssl):
+    staged = set()
+    for root, dirs, files in os.walk(FAEST_PATH):
+        dirs[:] = sorted(d for d in dirs if d not in FAEST_IGNORED_FOLDERS)
+        for file in files:
+            src = os.path.join(root, file)
+            rel = os.path.relpath(src, FAEST_PATH)
+            staged.add(rel)
+            with open(src, 'rb') as f:
+                content = f.read()
+            if rel == 'meson.build':
+                lines = switch_openssl(content.decode().splitlines(keepends=True), openssl)
+                content = ''.join(lines).encode()
+
+            target = os.path.join(dst, rel)
+            try:
+                with open(target, 'rb') as f:
+                    if f.read() == content:
+                        continue
+            except FileNotFoundError:
+                ensure_folder(os.path.dirname(target))
+            with open(target, 'wb') as f:
+                f.write(content)
+            shutil.copymode(src, target)
+
+    # Files removed from the sources
+    for root, _, files in os.walk(dst):
+        for file in files:
+            path = os.path.join(root, file)
+            if os.path.relpath(path, dst) not in staged:
+                os.remove(path)
+
+
+# Args of every configuration of the matrix, keyed by tag. Each has its own
+# staged sources, library build, test build and result folder.
+def matrix_configs(args):
+    configs = {}
+    for tag, flags, openssl in args['matrix']:
+        root = f'{TEST_BUILD_MATRIX_PATH}/{tag}'
+        configs[tag] = dict(args, **{'tag': tag,
+                                     'flags': flags,
+                                     'no-openssl': not openssl,
+                                     'faest-path': f'{root}/faest',
+                                     'lib-path': f'{root}/faest-build',
+                                     'build-path': f'{root}/tests',
+                                     'result-path': f'{TEST_RESULT_MATRIX_PATH}/{tag}'})
+    return configs
+
+
+# Configure (or reconfigure) and build the library of a configuration out of
+# tree. Returns None on success, otherwise the output of the failing command.
+def build_library(config):
+    stage_faest(config['faest-path'], not config['no-openssl'])
+
+    build = config['lib-path']
+    options = ['-Dbuildtype=plain', f'-Dc_args={shlex.join(config["flags"])}']
+    # The trace hook is resolved against the test programs at load time
+    if f'-D{TRACE_DEFINE}' in config['flags']:
+        options.append('-Db_lundef=false')
+    if os.path.isfile(f'{build}/build.ninja'):
+        cmds = [['meson', 'configure', build, *options]]
+    else:
+        cmds = [['meson', 'setup', *options, build, config['faest-path']]]
+    cmds.append(['ninja', '-C', build])
+
+    for cmd in cmds:
+        try:
+            process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        except FileNotFoundError:
+            return f'{cmd[0]} not found\n'
+        if config['verbose'] and process.stdout:
+            print(process.stdout, end='')
+        if process.returncode != 0:
+            return process.stdout
+    return None
+
+
+# Build every configuration, then run the tests of all configurations and
+# variants in one worker pool, and store and tabulate the results per tag
+def run_matrix(args):
+    configs = matrix_configs(args)
+    tests = args['tests']
+
+    print(f'Building FAEST configurations {list(configs)}')
+    with ThreadPoolExecutor(max_workers=min(args['threads'], len(configs))) as executor:
+        errors = list(zip(configs, executor.map(build_library, configs.values())))
+    for tag, output in errors:
+        if output is not None:
+            print(f'error building FAEST: {tag}')
+            print(output, end='')
+    if any(output is not None for _, output in errors):
+        exit(1)
+
+    print('Removing old results')
+    shutil.rmtree(TEST_RESULT_MATRIX_PATH, ignore_errors=True)
+    for config in configs.values():
+        ensure_result_folder(config)
+        copy_all(config)
+
+    print(f'Compiling variants ({args["threads"]} thread(s))')
+    compile_all(args, tests, configs)
+
+    print(f'Running {tests} in {list(configs)} ({args["threads"]} thread(s))')
+    run_all(args, tests, configs)
+
+    if args['stack']:
+        run_stack_check(args, tests, configs)
+        for config in configs.values():
+            write_stack_table(config)
+
+    mode = run_mode(args)
+    if mode == 'perf-record':
+        for config in configs.values():
+            fold_perf_record(result_folder(config, mode), args['threads'])
+    if mode in ('native', 'perf-record'):
+        return
+    run_ids = []
+    for tag, config in configs.items():
+        metadata = dict(run_metadata(config, mode), compiler_flags=shlex.join(config['flags']))
+        run_id = results_store.record_run(result_folder(config, mode), metadata, args['threads'])
+        if run_id is not None:
+            run_ids.append(run_id)
+    if not run_ids:
+        return
+    print(f'Stored results as runs {run_ids} in {results_store.STORE_PATH}')
+
+    conn = results_store.open_store()
+    with open(f'{TEST_RESULT_PATH}/matrix.md', 'w') as wf:
+        results_store.write_markdown_table(conn, run_ids, mode, results_store.MAIN_METRICS[mode], wf)
+    conn.close()
+    print(f'Wrote {TEST_RESULT_PATH}/matrix.md')
+
+
+def trace_config(args):
+    return dict(args, **{'tag': 'trace',
+                         'flags': TRACE_FLAGS,
+                         'faest-path': f'{TEST_BUILD_TRACE_PATH}/faest',
+                         'lib-path': f'{TEST_BUILD_TRACE_PATH}/faest-build',
+                         'build-path': f'{TEST_BUILD_TRACE_PATH}/tests'})
+
+
+# Build the instrumented library out of tree, record the access trace of
+# every variant and test, and compute the recomputation curves of all traces
+# in a process pool (written to test/results/recomp/trace)
+def run_trace(args):
+    # Imported here as it imports the variants from this module
+    import accessPatternToRecomputation
+
+    config = trace_config(args)
+    tests = args['tests']
+
+    print(f'Building FAEST with -D{TRACE_DEFINE}')
+    output = build_library(config)
+    if output is not None:
+        print('error building FAEST: trace')
+        print(output, end='')
+        exit(1)
+
+    print('Removing old results')
+    shutil.rmtree(TEST_RESULT_TRACE_PATH, ignore_errors=True)
+    ensure_result_folder(config)
+    copy_all(config)
+
+    print(f'Compiling variants ({args["threads"]} thread(s))')
+    compile_all(config, tests)
 
+    print(f'Running {tests} ({args["threads"]} thread(s))')
+    run_all(config, tests)
 
-def compile_all(args, program, name):
+    traces = [os.path.join(TEST_RESULT_TRACE_PATH, f) for f in sorted(os.listdir(TEST_RESULT_TRACE_PATH))
+              if f.endswith(accessPatternToRecomputation.BINARY_TRACE_EXTENSION)]
+    if not traces:
+        print(f'No accesses were traced, check that the VBB code calls faest_trace_access() under {TRACE_DEFINE}')
+        exit(1)
+
+    print(f'Computing recomputation curves of {len(traces)} trace(s)')
+    accessPatternToRecomputation.sweep_all(traces, args['threads'])
+
+
+def copy_all(args):
     for v in args['variants']:
-        compile(v, program, name, args['verbose'])
+        copy_files(v, args)
+
+
+# Compile the given tests for all variants (and configurations, see run_all)
+# in a pool of args['threads'] workers. Errors of all failing compilations
+# are reported before exiting.
+def compile_all(args, tests, configs=None):
+    if configs is None:
+        configs = {args['tag']: args}
+    programs = [(program, name) for name, program in TEST_LIST if name in tests]
+    if args['bench']:
+        programs = [(TEST_BENCH_FILE_NAME, 'bench')]
+    if args['stack']:
+        programs = [(TEST_STACK_FILE_NAME, 'stack')]
+    jobs = [(tag, v, program, name) for program, name in programs
+            for tag in configs for v in args['variants']]
+    library_hash = faest_hash()
+
+    with ThreadPoolExecutor(max_workers=args['threads']) as executor:
+        futures = [executor.submit(compile, v, program, name, configs[tag], library_hash)
+                   for tag, v, program, name in jobs]
+        errors = [(tag, v, name, f.result()) for (tag, v, _, name), f in zip(jobs, futures)]
 
+    success = True
+    for tag, v, name, output in errors:
+        if output is None:
+            continue
+        print(f'error compiling: {name} with {v}{f" ({tag})" if tag else ""}')
+        if output:
+            print(output, end='')
+        success = False
 
-def set_openssl(enable):
+    if not success:
+        exit(1)
+
+
+# meson.build lines with OpenSSL enabled or disabled
+def switch_openssl(lines, enable):
     if enable:
         pattern = 'if false'
         change_from = 'false'
@@ -284,12 +1125,13 @@ def set_openssl(enable):
         change_from = 'openssl.found()'
         change_to = 'false'
 
+    return [l.replace(change_from, change_to) if pattern in l else l for l in lines]
+
+
+def set_openssl(enable):
     meson_config_file = f'{FILEPATH}/faest/meson.build'
     with open(meson_config_file, 'r') as f:
-        lines = f.readlines()
-        for (i, l) in enumerate(lines):
-            if pattern in l:
-                lines[i] = l.replace(change_from, change_to)
+        lines = switch_openssl(f.readlines(), enable)
 
     with open(meson_config_file, 'w') as f:
         f.writelines(lines)
@@ -316,21 +1158,44 @@ def remove_results(args):
         shutil.rmtree(TEST_RESULT_CALLGRIND_PATH, ignore_errors=True)
     if args['tool'] == 'perf':
         shutil.rmtree(TEST_RESULT_PERF_PATH, ignore_errors=True)
+    if args['tool'] == 'perf-record':
+        shutil.rmtree(TEST_RESULT_PERF_RECORD_PATH, ignore_errors=True)
+    elif args['scaling']:
+        shutil.rmtree(TEST_RESULT_SCALING_PATH, ignore_errors=True)
+    elif args['throughput']:
+        shutil.rmtree(TEST_RESULT_THROUGHPUT_PATH, ignore_errors=True)
+    elif args['bench']:
+        shutil.rmtree(TEST_RESULT_BENCH_PATH, ignore_errors=True)
+    elif args['stack']:
+        shutil.rmtree(TEST_RESULT_STACK_PATH, ignore_errors=True)
+        shutil.rmtree(TEST_RESULT_STACK_CHECK_PATH, ignore_errors=True)
 
 
 if __name__ == '__main__':
     args = parse_args()
 
+    if args['matrix']:
+        run_matrix(args)
+        exit(0)
+
+    if args['trace']:
+        run_trace(args)
+        exit(0)
+
     if args['no-openssl']:
         print('Disabling OpenSSL')
         disable_openssl()
 
-    if not args['no-forced-rebuild']:
+    # ninja does not always detect changes, so clean if the sources changed
+    library_hash = faest_hash()
+    changed = read_hash(FAEST_HASH_FILE) != library_hash
+    if args['force-rebuild'] or (changed and not args['no-forced-rebuild']):
         print('Forcing rebuild of FAEST')
         clean_faest()  # NOTE do this while ninja does not behave
 
     print('Compiling FAEST')
     compile_faest(args['verbose'])
+    write_hash(FAEST_HASH_FILE, library_hash)
 
     if args['no-openssl']:
         print('Restoring OpenSSL')
@@ -341,16 +1206,40 @@ if __name__ == '__main__':
     ensure_result_folder(args)
     copy_all(args)
 
-    for o, n in TEST_LIST:
-        if o not in args['tests']:
-            continue
-        print(f'[Testing {o}]')
+    print(f'Compiling variants ({args["threads"]} thread(s))')
+    compile_all(args, args['tests'])
+
+    print(f'Running {args["tests"]} ({args["threads"]} thread(s))')
+    if args['scaling']:
+        run_scaling(args, args['tests'])
+        parse_scaling.parse_and_write(TEST_RESULT_SCALING_PATH, f'{TEST_RESULT_PATH}/scaling.md',
+                                      f'{TEST_RESULT_PATH}/scaling.csv')
+        print(f'Wrote {TEST_RESULT_PATH}/scaling.md and {TEST_RESULT_PATH}/scaling.csv')
+    elif args['throughput']:
+        run_throughput(args, args['tests'])
+        parse_throughput.parse_and_write(TEST_RESULT_THROUGHPUT_PATH, f'{TEST_RESULT_PATH}/throughput.md')
+        print(f'Wrote {TEST_RESULT_PATH}/throughput.md')
+    else:
+        run_all(args, args['tests'])
+
+    if args['stack']:
+        run_stack_check(args, args['tests'])
+        write_stack_table(args)
+
+    if args['tool'] == 'perf-record':
+        fold_perf_record(TEST_RESULT_PERF_RECORD_PATH, args['threads'])
 
-        print('> Compiling variants')
-        compile_all(args, n, o)
+    mode = run_mode(args)
+    run_id = results_store.record_run(mode_result_path(mode), run_metadata(args, mode), args['threads'])
+    if run_id is not None:
+        print(f'Stored results as run {run_id} in {results_store.STORE_PATH}')
 
-        print(f'Running variants ({args["threads"]} thread(s))')
-        run_all(args, o)
+    if mode == 'bench' and run_id is not None:
+        conn = results_store.open_store()
+        summaries = results_store.summaries(conn, run_id, 'bench', results_store.BENCH_METRICS)
+        parse_bench.write_markdown_table(summaries, f'{TEST_RESULT_PATH}/bench.md')
+        conn.close()
+        print(f'Wrote {TEST_RESULT_PATH}/bench.md')
 
     exit(0)
 
@@ -360,4 +1249,4 @@ if __name__ == '__main__':
 
     filename = f'results{"-no-openssl" if args["no-openssl"] else ""}.md'
     parse_and_write(TEST_RESULT_MASSIF_PATH,
-                    f'{TEST_RESULT_PATH}/{filename}', groups)
+                    f'{TEST_RESULT_PATH}/{filename}', groups, args['threads'])
@@ -2,10 +2,9 @@
 # This script uses the prepare_nist.py script to export the
 # specified implementation to the pqm4 project.
 import os
-import sys
+import argparse
 import subprocess
-import shutil
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 TARGET_DIR = "target"
 
@@ -13,91 +12,151 @@ TARGET_DIR = "target"
 all = ['faest_128f', 'faest_128s', 'faest_192f', 'faest_192s', 'faest_256f', 'faest_256s',\
         'faest_em_128f', 'faest_em_128s', 'faest_em_192f', 'faest_em_192s', 'faest_em_256f', 'faest_em_256s']
 
+CONFIG_HEADER = "#define HAVE_RANDOMBYTES\n#define PQCLEAN\n"
+CONFIG_INCLUDE = '#include "config.h"\n'
+# Files that need config.h, but do not include it themselves
+CONFIG_INCLUDE_FILES = ["aes.c", "randomness.c", "hash_shake.h"]
 
+
+def pqm4_folder(name: str):
+    return f"pqm4/crypto_sign/{name}_masked/m4"
+
+
+# Every variant gets its own target folder, so they can be prepared in parallel.
+# Returns None on success, otherwise the output of prepare_nist.py
 def prepare_single(name: str):
-    print(f"Preparing {name}")
     cmd = ["python3",
            "faest/tools/prepare_nist.py",
            "faest",
            "faest/build",
-           TARGET_DIR,
+           f"{TARGET_DIR}/{name}",
            name]
-    r = subprocess.run(cmd, text=True)
+    r = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
     if r.returncode != 0:
-        exit(1)
+        return r.stdout
+    return None
+
+
+def read_file(path: str):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# Include config.h first, unless the file already does
+def include_config(data: bytes):
+    include = CONFIG_INCLUDE.encode()
+    if data.startswith(include):
+        return data
+    return include + data
+
+
+# The content of the m4 folder of a variant as {relative path: (bytes, source path)}.
+# The sources of sha3/ are moved to the top, with sha3/config.h merged into config.h
+def export_files(name: str):
+    src = f"{TARGET_DIR}/{name}/Reference_Implementation/{name}"
+    files = {}
+    sha3_config = None
+    for root, dirs, names in os.walk(src):
+        dirs.sort()
+        for file in sorted(names):
+            path = os.path.join(root, file)
+            rel = os.path.relpath(path, src)
+            parts = rel.split(os.sep)
+            if parts[0] == "sha3":
+                if parts[1:] == ["config.h"]:
+                    sha3_config = read_file(path)
+                    continue
+                rel = os.path.join(*parts[1:])
+            files[rel] = (read_file(path), path)
+
+    config = CONFIG_HEADER.encode()
+    if sha3_config is not None:
+        config += b"\n" + sha3_config
+    files["config.h"] = (config, None)
+
+    for file in CONFIG_INCLUDE_FILES:
+        data, path = files[file]
+        files[file] = (include_config(data), path)
+    return files
+
+
+# Write the files that changed to folder and remove files
+# that are not exported anymore. Returns the number of written and removed files
+def sync_folder(files, folder: str):
+    written = 0
+    for rel, (data, source) in files.items():
+        target = os.path.join(folder, rel)
+        try:
+            if read_file(target) == data:
+                continue
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(data)
+        if source is not None:
+            os.chmod(target, os.stat(source).st_mode & 0o777)
+        written += 1
+
+    removed = 0
+    for root, dirs, names in os.walk(folder, topdown=False):
+        for file in names:
+            path = os.path.join(root, file)
+            if os.path.relpath(path, folder) not in files:
+                os.remove(path)
+                removed += 1
+        if root != folder and not os.listdir(root):
+            os.rmdir(root)
+    return written, removed
 
 
-def prepare_all():
-    for e in all:
-        prepare_single(e)
+def move_single_to_pqm4(name: str):
+    return sync_folder(export_files(name), pqm4_folder(name))
 
 
-def move_single_to_pqm4(name: str):
-    folder = f"pqm4/crypto_sign/{name}_masked/m4"
-
-    # Remove existing folder with content
-    try:
-        shutil.rmtree(folder)
-    except FileNotFoundError:
-        pass
-
-    # Copy to folder
-    shutil.copytree(f"target/Reference_Implementation/{name}", folder)
-
-    # Make config.h in folder
-    with open(f"{folder}/config.h", "w") as f:
-        f.write(f"#define HAVE_RANDOMBYTES\n")
-        f.write(f"#define PQCLEAN\n")
-
-    # move content of sha3 out while merging config.h
-    project_root = Path(folder)
-    sha3_sources = project_root / "sha3"
-    for source in sha3_sources.glob("*"):
-        if "config.h" in source.as_posix():
-            with open(f"{folder}/sha3/config.h", "r") as f:
-                conf = f.read()
-            with open(f"{folder}/config.h", "a") as f:
-                f.write("\n")
-                f.write(conf)
+# Returns (name, written, removed, None) or (name, 0, 0, error output)
+def export_single(name: str):
+    output = prepare_single(name)
+    if output is not None:
+        return name, 0, 0, output
+    written, removed = move_single_to_pqm4(name)
+    return name, written, removed, None
+
+
+def export_all(names, threads=1):
+    with ProcessPoolExecutor(max_workers=max(1, min(threads, len(names)))) as executor:
+        results = list(executor.map(export_single, names))
+
+    success = True
+    for name, written, removed, output in results:
+        if output is not None:
+            print(f"Preparing {name} failed")
+            print(output, end="")
+            success = False
         else:
-            shutil.move(source, project_root)
-    shutil.rmtree(sha3_sources)
-    
-    # Prepend '#include "config.h"' to aes.c, randomness.c and hash_shake.h
-    with open(f"{folder}/aes.c", "r") as f:
-        data = f.read()
-    with open(f"{folder}/aes.c", "w") as f:
-        f.write('#include "config.h"\n')
-        f.write(data)
-    with open(f"{folder}/randomness.c", "r") as f:
-        data = f.read()
-    with open(f"{folder}/randomness.c", "w") as f:
-        f.write('#include "config.h"\n')
-        f.write(data)
-    with open(f"{folder}/hash_shake.h", "r") as f:
-        data = f.read()
-    with open(f"{folder}/hash_shake.h", "w") as f:
-        f.write('#include "config.h"\n')
-        f.write(data)
-
-
-
-
-def move_all_to_pqm4():
-    for e in all:
-        move_single_to_pqm4(e)
+            print(f"{name}: {written} file(s) updated, {removed} removed")
+    return success
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export FAEST variants to pqm4, only writing changed files.")
+
+    parser.add_argument("names", nargs="*",
+                        help="Variants to export, fx faest_128f. If empty, all are exported")
+    parser.add_argument("-t", "--threads", type=int, default=0,
+                        help="Process count. Set to 0 for max utilization (default: 0)")
+
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in all:
+            parser.error(f"{name} is not a valid variant. Only {all} may be used")
+    return args
 
 
 if __name__ == '__main__':
+    args = parse_args()
+    threads = args.threads if args.threads > 0 else os.cpu_count()
+
     # Create target dir for temporary files
     os.makedirs(TARGET_DIR, exist_ok=True)
 
-    # Prepare files
-    if len(sys.argv) == 1:
-        prepare_all()
-        move_all_to_pqm4()
-    elif len(sys.argv) == 2:
-        name = sys.argv[1]
-        prepare_single(name)
-        move_single_to_pqm4(name)
-    
+    exit(0 if export_all(args.names or all, threads) else 1)
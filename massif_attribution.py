@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# This script attributes the heap of massif snapshots to allocating call
+# paths. It reports the top call paths at the peak (and selected snapshots)
+# of every file, or how the breakdown changed between two runs.
+import os
+import sys
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import parse_massif
+from compare_results import find_results, sort_key
+
+ARROW = ' <- '
+
+
+# Massif files of a file or folder, keyed by (variant, operation) or file name
+def massif_files(path):
+    if os.path.isfile(path):
+        return {os.path.basename(path): path}
+    results = find_results(path)
+    return {(variant, operation): p for (tool, variant, operation), p in results.items()
+            if tool == 'massif'}
+
+
+# Attribution of the selected snapshots of a file, as a list of
+# (snapshot label, Snapshot, [(frames, bytes)]), None for snapshots without
+# a heap tree. Raises ValueError for snapshots that do not exist.
+def attribute_file(path, snapshots, depth, locations):
+    f = parse_massif.parse_file(path, heap_trees=set(snapshots))
+    result = []
+    for s in snapshots:
+        index = f.series.peak_index if s == 'peak' else s
+        if not 0 <= index < len(f.series):
+            raise ValueError(f'{path} has no snapshot {s}, valid snapshots are 0-{len(f.series) - 1}')
+        lines = f.heap_trees.get(index)
+        if lines is None:
+            result.append(None)
+            continue
+        label = f'{index} (peak)' if s == 'peak' else str(index)
+        paths = [(k, v) for k, v in parse_massif.attribute(lines, depth, locations) if v > 0]
+        result.append((label, f.series.snapshot(index), paths))
+    return result
+
+
+def attribute_all(paths, snapshots, depth, locations, threads):
+    attribute = partial(attribute_file, snapshots=snapshots, depth=depth, locations=locations)
+    if threads > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(threads, len(paths))) as executor:
+            return list(executor.map(attribute, paths))
+    return [attribute(p) for p in paths]
+
+
+def key_name(key):
+    return ' '.join(key) if isinstance(key, tuple) else key
+
+
+def percent(part, total):
+    return f'{100 * part / total:.1f}%' if total else '-'
+
+
+def write_header(wf, title, snapshot):
+    wf.write(f'\n## {title}\n\n')
+    wf.write(f'Heap {snapshot.usefull_heap:,} B (+{snapshot.extra_heap:,} B allocator overhead),'
+             f' stack {snapshot.stack:,} B\n\n')
+
+
+def write_attribution(wf, name, attribution, top):
+    for label, snapshot, paths in filter(None, attribution):
+        write_header(wf, f'{name}, snapshot {label}', snapshot)
+        if not paths:
+            wf.write('No heap allocations\n' if not snapshot.usefull_heap else 'No heap tree in this snapshot\n')
+            continue
+        wf.write('| # | Bytes | % | Call path |\n')
+        wf.write('|--:|------:|--:|:----------|\n')
+        for i, (frames, size) in enumerate(paths[:top], 1):
+            wf.write(f'| {i} | {size:,} | {percent(size, snapshot.usefull_heap)} | {ARROW.join(frames)} |\n')
+        rest = sum(size for _, size in paths[top:])
+        if rest:
+            wf.write(f'| | {rest:,} | {percent(rest, snapshot.usefull_heap)} | {len(paths) - top} other paths |\n')
+
+
+# Call paths ordered by the largest absolute change
+def diff_paths(before, after):
+    before = dict(before)
+    after = dict(after)
+    rows = [(frames, before.get(frames, 0), after.get(frames, 0)) for frames in before.keys() | after.keys()]
+    return sorted(rows, key=lambda r: (-abs(r[2] - r[1]), r[0]))
+
+
+def write_diff(wf, name, before, after, top):
+    for b, a in zip(before, after):
+        if b is None or a is None:
+            continue
+        (label_b, snap_b, paths_b), (label_a, snap_a, paths_a) = b, a
+        wf.write(f'\n## {name}, snapshot {label_b} -> {label_a}\n\n')
+        wf.write(f'Heap before {snap_b.usefull_heap:,} B, after {snap_a.usefull_heap:,} B'
+                 f' ({snap_a.usefull_heap - snap_b.usefull_heap:+,} B)\n\n')
+        rows = [r for r in diff_paths(paths_b, paths_a)[:top] if r[1] != r[2]]
+        if not rows:
+            wf.write('No heap allocations\n' if not paths_b and not paths_a else 'No change\n')
+            continue
+        wf.write('| Call path | Before (B) | After (B) | Change (B) | Before % | After % |\n')
+        wf.write('|:----------|-----------:|----------:|-----------:|---------:|--------:|\n')
+        for frames, b, a in rows:
+            wf.write(f'| {ARROW.join(frames)} | {b:,} | {a:,} | {a - b:+,} |'
+                     f' {percent(b, snap_b.usefull_heap)} | {percent(a, snap_a.usefull_heap)} |\n')
+
+
+def file_sort_key(key):
+    return sort_key(('massif', *key)) if isinstance(key, tuple) else (key,)
+
+
+def snapshot_arg(value):
+    return value if value == 'peak' else int(value)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Attribute massif heap snapshots to allocating call paths.')
+
+    parser.add_argument('before', help='Massif file or result folder')
+    parser.add_argument('after', nargs='?', default=None,
+                        help='Massif file or result folder to compare against before')
+    parser.add_argument('-s', '--snapshots', type=snapshot_arg, nargs='+', default=['peak'],
+                        help='Snapshot indices to attribute, \'peak\' for the peak (default: peak)')
+    parser.add_argument('-n', '--top', type=int, default=10,
+                        help='Number of call paths per snapshot (default: 10)')
+    parser.add_argument('-d', '--depth', type=int, default=None,
+                        help='Only keep this many frames from the allocation site, merging the rest (default: all)')
+    parser.add_argument('--no-lines', action='store_true', default=False,
+                        help='Merge frames of the same function and file, needed if line numbers moved between runs')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Write markdown to file instead of stdout')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='Process count. Set to 0 for max utilization (default: 1)')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    threads = args.threads if args.threads > 0 else os.cpu_count()
+    locations = not args.no_lines
+
+    before = massif_files(args.before)
+    after = massif_files(args.after) if args.after else None
+    if after is not None and os.path.isfile(args.before) and os.path.isfile(args.after):
+        after = {k: after[a] for k, a in zip(before, after)}
+
+    names = sorted(before if after is None else before.keys() & after.keys(), key=file_sort_key)
+    if not names:
+        print('No matching massif files found')
+        exit(1)
+
+    try:
+        attributions = attribute_all([before[n] for n in names], args.snapshots, args.depth, locations, threads)
+        if after is not None:
+            attributions_after = attribute_all([after[n] for n in names], args.snapshots, args.depth, locations, threads)
+    except ValueError as e:
+        print(e)
+        exit(1)
+
+    wf = open(args.output, 'w') if args.output else sys.stdout
+    wf.write('# Heap attribution\n')
+    for i, name in enumerate(names):
+        if after is None:
+            write_attribution(wf, key_name(name), attributions[i], args.top)
+        else:
+            write_diff(wf, key_name(name), attributions[i], attributions_after[i], args.top)
+    if args.output:
+        wf.close()
+    exit(0)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# Pareto frontier of cache bytes vs recomputations for every access trace,
+# written as markdown tables and plots.
+import os
+import argparse
+
+from accessPatternToRecomputation import (MIN_OLES, PARAMETERS, curve_cache_sizes, default_traces,
+                                          load_trace, trace_variant)
+from recomputationPolicies import POLICIES, policy_curve
+from parse_cache import ParseCache, parse_all
+from parse_massif import list_folder, summarize_file
+
+FILEPATH = os.path.dirname(os.path.realpath(__file__))
+OUT_PATH = f'{FILEPATH}/test/results/pareto'
+
+TRACE_ROLES = {'prover': 'sign', 'verifier': 'verify'}
+
+
+# A cached element is a row of the VOLE correlation, lambda bits
+def element_bytes(lamb):
+    return lamb // 8
+
+
+# cache_size is an index, so the cache holds cache_size + 1 elements
+def cache_bytes(cache_size, lamb, per_element=None):
+    if per_element is None:
+        per_element = element_bytes(lamb)
+    return (cache_size + 1) * per_element
+
+
+# Points (bytes, recomputations, cache_size) that are not dominated by a
+# smaller cache. Since bytes grow with the cache size, these are the points
+# where the recomputations reach a new minimum.
+def pareto_frontier(cache_sizes, curve, lamb, per_element=None):
+    frontier = []
+    best = None
+    for c, r in zip(cache_sizes, curve):
+        if r is None:
+            continue
+        if best is None or r < best:
+            best = r
+            frontier.append((cache_bytes(c, lamb, per_element), r, c))
+    return frontier
+
+
+def trace_name(trace):
+    name, _ = os.path.splitext(os.path.basename(trace))
+    return f'{os.path.basename(os.path.dirname(os.path.abspath(trace)))}/{name}'
+
+
+# Massif result name of a trace, fx 'em128f_prover.txt' -> 'EM128f_sign'
+def massif_name(trace):
+    name, _ = os.path.splitext(os.path.basename(trace))
+    name = name.replace('-', '_')
+    variant, _, role = name.partition('_')
+    role = TRACE_ROLES.get(role.lower(), role.lower())
+    if not role or variant[-1].lower() not in 'fs':
+        return None
+    variant = variant[:-1].upper() + variant[-1].lower()
+    return f'{variant}_{role}'
+
+
+def frontier_of_trace(trace, policy, min_oles=MIN_OLES, per_element=None):
+    l, lamb = PARAMETERS[trace_variant(trace)]
+    sizes = curve_cache_sizes(min_oles, l, lamb)
+    curve = policy_curve(policy, load_trace(trace), sizes, l)
+    if curve is None:
+        return sizes, None, None
+    return sizes, curve, pareto_frontier(sizes, curve, lamb, per_element)
+
+
+# Peak memory of every massif file in dir_path, keyed by file name
+def massif_peaks(dir_path):
+    paths = list_folder(dir_path, '')
+    summaries = parse_all(paths, summarize_file, cache=ParseCache())
+    return {os.path.basename(p): s['peak'] for p, s in zip(paths, summaries)}
+
+
+def write_markdown(results, peaks, outpath):
+    with open(outpath, 'w') as wf:
+        for trace, (_, _, frontier) in results:
+            name = trace_name(trace)
+            wf.write(f'### {name}\n\n')
+            peak = peaks.get(massif_name(trace))
+            if peak is not None:
+                wf.write(f'Measured peak memory (massif): {peak:,} B\n\n')
+            if frontier is None:
+                wf.write('Skipped, every element is accessed once, so the policy can not save recomputations\n\n')
+                continue
+            wf.write('| Cache size (elements) | Cache (B) | Recomputations |\n')
+            wf.write('|----------------------:|----------:|---------------:|\n')
+            for b, r, c in frontier:
+                wf.write(f'| {c + 1:,} | {b:,} | {r:,} |\n')
+            wf.write('\n')
+
+
+def plot(results, out_dir, policy, per_element=None):
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print('matplotlib not found, skipping plots')
+        return
+
+    for trace, (sizes, curve, frontier) in results:
+        if curve is None:
+            continue
+        lamb = PARAMETERS[trace_variant(trace)][1]
+        points = [(cache_bytes(c, lamb, per_element), r) for c, r in zip(sizes, curve) if r is not None]
+
+        fig, ax = plt.subplots()
+        ax.plot([b for b, _ in points], [r for _, r in points], linewidth=0.8, label=policy)
+        ax.scatter([b for b, _, _ in frontier], [r for _, r, _ in frontier],
+                   s=6, color='red', label='Pareto frontier')
+        ax.set_xlabel('Cache (bytes)')
+        ax.set_ylabel('Recomputations')
+        ax.set_yscale('log')
+        ax.set_title(trace_name(trace))
+        ax.legend()
+
+        name = trace_name(trace).replace('/', '-')
+        fig.savefig(os.path.join(out_dir, f'pareto-{name}.png'), dpi=150)
+        plt.close(fig)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Pareto frontier of cache bytes vs recomputations.')
+
+    parser.add_argument('traces', nargs='*',
+                        help='Trace files. If empty, all saved traces are used')
+    parser.add_argument('-p', '--policy', default='window', choices=list(POLICIES),
+                        help='Cache policy (default: window)')
+    parser.add_argument('--element-bytes', type=int, default=None,
+                        help='Bytes per cached element (default: lambda / 8)')
+    parser.add_argument('--massif', default=None,
+                        help='Folder with massif results to show measured peaks next to the frontier')
+    parser.add_argument('-o', '--out-dir', default=OUT_PATH,
+                        help='Output folder (default: test/results/pareto)')
+    parser.add_argument('--no-plot', action='store_true', default=False,
+                        help='Only write the markdown tables')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    traces = args.traces if args.traces else default_traces()
+    results = [(t, frontier_of_trace(t, args.policy, per_element=args.element_bytes)) for t in traces]
+
+    peaks = massif_peaks(args.massif) if args.massif else {}
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    write_markdown(results, peaks, os.path.join(args.out_dir, 'pareto.md'))
+    if not args.no_plot:
+        plot(results, args.out_dir, args.policy, args.element_bytes)
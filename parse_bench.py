@@ -0,0 +1,134 @@
+# This script is used to parse the output of the in-process benchmark
+# harness (faest_test.py --bench) and create a markdown table.
+import os
+import math
+
+from parse_perf import Z_975
+
+TEST_NAMES = ['keygen', 'sign', 'verify']
+
+
+# Linear interpolation between closest ranks, values must be sorted
+def percentile(values, p):
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+# Half width of the distribution free 95% confidence interval of the median
+# relative to the median, values must be sorted. The interval is given by the
+# ranks n/2 -+ 1.96 sqrt(n)/2 (and one more above), so small samples span
+# (almost) all values.
+def median_rel_ci(values):
+    n = len(values)
+    median = percentile(values, 50)
+    if n < 2 or not median:
+        return None
+    half = Z_975 * math.sqrt(n) / 2
+    lo = max(math.floor(n / 2 - half), 1)
+    hi = min(math.ceil(n / 2 + half) + 1, n)
+    return (values[hi - 1] - values[lo - 1]) / 2 / median
+
+
+class Bench:
+    def __init__(self, name, ns, cycles, instructions):
+        self.name = name
+        self.ns = sorted(ns)
+        self.cycles = sorted(cycles)
+        self.instructions = sorted(instructions)
+
+    def __str__(self):
+        return f'Bench: {self.name}, Median: {self.median()}ns'
+
+    def median(self):
+        return percentile(self.ns, 50)
+
+    def ops_per_second(self):
+        return 1e9 * len(self.ns) / sum(self.ns)
+
+
+# Each line is 'ns cycles instructions', where unavailable counters are -1
+def parse_file(filename):
+    ns = []
+    cycles = []
+    instructions = []
+    with open(filename, 'r') as f:
+        for line in f:
+            values = [int(v) for v in line.split()]
+            if not values:
+                continue
+            ns.append(values[0])
+            if len(values) > 1 and values[1] >= 0:
+                cycles.append(values[1])
+            if len(values) > 2 and values[2] >= 0:
+                instructions.append(values[2])
+
+    name = os.path.basename(filename)
+    if name.startswith('bench_'):
+        name = name[len('bench_'):]
+    return Bench(name, ns, cycles, instructions)
+
+
+def summarize_file(filename):
+    b = parse_file(filename)
+    return {'name': b.name,
+            'iterations': len(b.ns),
+            'median_ns': b.median(),
+            'median_rel_ci': median_rel_ci(b.ns),
+            'p10_ns': percentile(b.ns, 10),
+            'p90_ns': percentile(b.ns, 90),
+            'p99_ns': percentile(b.ns, 99),
+            'ops_per_second': b.ops_per_second() if b.ns else None,
+            'median_cycles': percentile(b.cycles, 50),
+            'median_instructions': percentile(b.instructions, 50)}
+
+
+def parse_folder(dir_path):
+    summaries = []
+    for element in sorted(os.listdir(dir_path)):
+        path = os.path.join(dir_path, element)
+        if not os.path.isfile(path) or not element.startswith('bench_'):
+            continue
+        summaries.append(summarize_file(path))
+    return summaries
+
+
+def sort_key(summary):
+    variant, _, operation = summary['name'].rpartition('_')
+    op = TEST_NAMES.index(operation) if operation in TEST_NAMES else len(TEST_NAMES)
+    return (variant[-1], variant[:-1], op)
+
+
+def format_count(value):
+    return f'{value:,.0f}' if value is not None else '-'
+
+
+def format_precision(rel_ci):
+    return f'±{100 * rel_ci:.2f}%' if rel_ci is not None else '-'
+
+
+def write_markdown_table(summaries, outpath):
+    with open(outpath, 'w') as wf:
+        wf.write('| Variant | Operation | Iterations | Median (ms) | 95% CI | P10 (ms) | P90 (ms) | P99 (ms) | ops/s | Median cycles | Median instructions |\n')
+        wf.write('|:-------:|:---------:|-----------:|------------:|-------:|---------:|---------:|---------:|------:|--------------:|--------------------:|\n')
+        for s in sorted(summaries, key=sort_key):
+            if not s['iterations']:
+                continue
+            variant, _, operation = s['name'].rpartition('_')
+            wf.write(f'| {variant} | {operation} | {s["iterations"]:.0f} |'
+                     f' {s["median_ns"] / 1e6:,.3f} | {format_precision(s["median_rel_ci"])} | {s["p10_ns"] / 1e6:,.3f} |'
+                     f' {s["p90_ns"] / 1e6:,.3f} | {s["p99_ns"] / 1e6:,.3f} |'
+                     f' {s["ops_per_second"]:,.1f} | {format_count(s["median_cycles"])} |'
+                     f' {format_count(s["median_instructions"])} |\n')
+
+
+def parse_and_write(dir_path, outpath):
+    write_markdown_table(parse_folder(dir_path), outpath)
+
+
+if __name__ == '__main__':
+    print('This script should not be run directly')
+    exit(1)
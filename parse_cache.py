@@ -0,0 +1,100 @@
+# This script is used to parse result files in parallel while caching the
+# parsed summaries on disk, so unchanged files are never parsed twice.
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+FILEPATH = os.path.dirname(os.path.realpath(__file__))
+CACHE_PATH = f'{FILEPATH}/test/.cache/parse-cache.json'
+
+# Bump when the layout or the parsing of a cached summary changes
+CACHE_VERSION = 5
+
+
+def parser_key(parser):
+    return f'{parser.__module__}.{parser.__name__}'
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+# On-disk cache of parsed summaries keyed by path, mtime and size.
+# Summaries must be JSON serializable.
+class ParseCache:
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+
+        try:
+            with open(path, 'r') as f:
+                content = json.load(f)
+            if content.get('version') == CACHE_VERSION:
+                self.entries = content['entries']
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def get(self, parser, path):
+        entry = self.entries.get(os.path.abspath(path), {}).get(parser_key(parser))
+        if entry is None:
+            return None
+        mtime, size = file_stamp(path)
+        if entry['mtime'] != mtime or entry['size'] != size:
+            return None
+        return entry['summary']
+
+    def put(self, parser, path, summary):
+        mtime, size = file_stamp(path)
+        per_file = self.entries.setdefault(os.path.abspath(path), {})
+        per_file[parser_key(parser)] = {'mtime': mtime, 'size': size, 'summary': summary}
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'entries': self.entries}, f)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+# Parse all paths with parser (a module level function returning a JSON
+# serializable summary). Files not in the cache are parsed in a process pool.
+# Results are returned in the same order as paths.
+def parse_all(paths, parser, threads=1, cache=None):
+    summaries = [None] * len(paths)
+    missing = []
+    for i, path in enumerate(paths):
+        if cache is not None:
+            summaries[i] = cache.get(parser, path)
+        if summaries[i] is None:
+            missing.append(i)
+
+    if threads <= 0:
+        threads = os.cpu_count()
+    threads = min(threads, len(missing))
+
+    todo = [paths[i] for i in missing]
+    if threads > 1:
+        with ProcessPoolExecutor(max_workers=threads) as executor:
+            parsed = list(executor.map(parser, todo))
+    else:
+        parsed = [parser(p) for p in todo]
+
+    for i, summary in zip(missing, parsed):
+        summaries[i] = summary
+        if cache is not None:
+            cache.put(parser, paths[i], summary)
+
+    if cache is not None:
+        cache.save()
+    return summaries
+
+
+if __name__ == '__main__':
+    print('This script should not be run directly')
+    exit(1)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# This script is used to parse callgrind output files and create markdown
+# tables of the hottest functions.
+import os
+import argparse
+
+from parse_cache import ParseCache, parse_all
+
+# Amount of functions kept in cached summaries
+TOP_CACHED = 50
+
+
+class Function:
+    def __init__(self, name, file):
+        self.name = name
+        self.file = file
+        self.exclusive = 0
+        self.inclusive = 0
+        self.calls = 0
+
+    def __str__(self):
+        return f'{self.name}: inclusive {self.inclusive}, exclusive {self.exclusive}'
+
+
+class Profile:
+    def __init__(self, name, events, totals, functions):
+        self.name = name
+        self.events = events
+        self.totals = totals
+        self.functions = functions
+
+    def __str__(self):
+        return f'Profile: {self.name}, Total Ir: {self.total()}'
+
+    def total(self, event='Ir'):
+        return self.totals[self.events.index(event)]
+
+    def hottest(self, n, inclusive=True):
+        key = (lambda f: f.inclusive) if inclusive else (lambda f: f.exclusive)
+        return sorted(self.functions.values(), key=key, reverse=True)[:n]
+
+
+# Resolves callgrind name compression, '(id) name' defines and '(id)' refers
+class NameTable:
+    def __init__(self):
+        self.names = {}
+
+    def resolve(self, value):
+        if not value.startswith('('):
+            return value
+        end = value.index(')')
+        id = value[1:end]
+        name = value[end + 1:].strip()
+        if name:
+            self.names[id] = name
+            return name
+        return self.names[id]
+
+
+def split_name(name):
+    idx = name.rfind('_')
+    if idx == -1:
+        return name, ''
+    return name[:idx], name[idx + 1:]
+
+
+# Stream a callgrind file and compute exclusive and inclusive cost of every
+# function. Calls from a function to itself are not added to its inclusive
+# cost, like callgrind_annotate does.
+def parse_file(filename, event='Ir'):
+    files = NameTable()
+    fns = NameTable()
+
+    events = []
+    totals = None
+    functions = {}
+    positions = 1
+    idx = 0
+
+    fl = fi = fn = None
+    current = None
+    cfn = cfl = None
+    call_pending = False
+
+    with open(filename, 'r') as f:
+        for line in f:
+            c = line[0]
+            # Cost lines are by far the most common
+            if c.isdigit() or c == '+' or c == '-' or c == '*':
+                if current is None:
+                    continue
+                costs = line.split()
+                cost = int(costs[positions + idx]) if len(costs) > positions + idx else 0
+                if call_pending:
+                    call_pending = False
+                    callee = (cfl, cfn)
+                    # cfi/cfl only apply to this call
+                    cfl = None
+                    if callee != (current.file, current.name):
+                        current.inclusive += cost
+                else:
+                    current.exclusive += cost
+                    current.inclusive += cost
+                continue
+
+            if c == '\n' or c == '#':
+                continue
+
+            key, _, value = line.rstrip('\n').partition('=')
+            if key == 'fn':
+                fn = fns.resolve(value)
+                fi = None
+                current = functions.get((fl, fn))
+                if current is None:
+                    current = Function(fn, fl)
+                    functions[(fl, fn)] = current
+            elif key == 'fl':
+                fl = files.resolve(value)
+            elif key == 'fi' or key == 'fe':
+                fi = files.resolve(value)
+            elif key == 'cfn':
+                cfn = fns.resolve(value)
+            elif key == 'cfi' or key == 'cfl':
+                cfl = files.resolve(value)
+            elif key == 'calls':
+                call_pending = True
+                # Without cfi/cfl the callee is in the current (inlined) file
+                if cfl is None:
+                    cfl = fi or fl
+                callee = functions.get((cfl, cfn))
+                if callee is None:
+                    callee = Function(cfn, cfl)
+                    functions[(cfl, cfn)] = callee
+                callee.calls += int(value.split()[0])
+            elif key == 'ob' or key == 'cob':
+                continue
+            elif key.startswith('events:'):
+                events = key[len('events:'):].split()
+                idx = events.index(event)
+            elif key.startswith('positions:'):
+                positions = len(key[len('positions:'):].split())
+            elif key.startswith('totals:') or key.startswith('summary:'):
+                totals = [int(x) for x in key.split(':')[1].split()]
+
+            # cfi/cfl only apply to the following call
+            if key != 'cfi' and key != 'cfl' and key != 'cfn' and key != 'calls':
+                cfl = None
+
+    if totals is None:
+        totals = [0] * len(events)
+        totals[idx] = sum(f.exclusive for f in functions.values())
+
+    name = os.path.basename(filename)
+    return Profile(name, events, totals, functions)
+
+
+def summarize_file(filename):
+    profile = parse_file(filename)
+    return {'name': profile.name,
+            'events': profile.events,
+            'totals': profile.totals,
+            'top': [{'name': f.name,
+                     'file': f.file,
+                     'inclusive': f.inclusive,
+                     'exclusive': f.exclusive,
+                     'calls': f.calls} for f in profile.hottest(TOP_CACHED)]}
+
+
+def list_folder(dir_path):
+    paths = []
+    for element in sorted(os.listdir(dir_path)):
+        path = os.path.join(dir_path, element)
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'r', errors='replace') as f:
+            if not f.readline().startswith('# callgrind format'):
+                continue
+        paths.append(path)
+    return paths
+
+
+def summarize_folder(dir_path, threads=1, cache=None):
+    return parse_all(list_folder(dir_path), summarize_file, threads, cache)
+
+
+def sort_key(name):
+    variant, operation = split_name(name)
+    operations = ['keygen', 'sign', 'verify']
+    op = operations.index(operation) if operation in operations else len(operations)
+    return (variant[-1], variant[:-1], op)
+
+
+def write_markdown_table(summaries, outpath, top):
+    with open(outpath, 'w') as wf:
+        for s in sorted(summaries, key=lambda s: sort_key(s['name'])):
+            total = s['totals'][s['events'].index('Ir')]
+            variant, operation = split_name(s['name'])
+            wf.write(f'### {variant} {operation} ({total:,} Ir)\n\n')
+            wf.write('| Function | Inclusive Ir | Incl. % | Exclusive Ir | Excl. % | Calls |\n')
+            wf.write('|:---------|-------------:|--------:|-------------:|--------:|------:|\n')
+            for f in s['top'][:top]:
+                wf.write(f'| {f["name"]} | {f["inclusive"]:,} | {100 * f["inclusive"] / total:.2f}% |'
+                         f' {f["exclusive"]:,} | {100 * f["exclusive"] / total:.2f}% | {f["calls"]:,} |\n')
+            wf.write('\n')
+
+
+def parse_and_write(dir_path, outpath, top=20, threads=1, use_cache=True):
+    cache = ParseCache() if use_cache else None
+    write_markdown_table(summarize_folder(dir_path, threads, cache), outpath, top)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Create tables of the hottest functions in callgrind files.')
+
+    parser.add_argument('folder', help='Folder with callgrind files')
+    parser.add_argument('-o', '--output', default='callgrind.md',
+                        help='Output markdown file (default: callgrind.md)')
+    parser.add_argument('-n', '--top', type=int, default=20,
+                        help=f'Functions per table, at most {TOP_CACHED} (default: 20)')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='Process count. Set to 0 for max utilization (default: 1)')
+    parser.add_argument('--no-cache', action='store_true', default=False,
+                        help='Do not use the parse cache')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    parse_and_write(args.folder, args.output, min(args.top, TOP_CACHED),
+                    args.threads, not args.no_cache)
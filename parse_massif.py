@@ -1,5 +1,15 @@
 # This script is used to parse massif output files and create a markdown table.
 import os
+import re
+from array import array
+
+from parse_cache import ParseCache, parse_all
+
+
+# '  n2: 1234 0x4854FBA: faest_sign (faest.c:284)'
+TREE_LINE_RE = re.compile(r'^( *)n(\d+): (\d+) (.*)$')
+FRAME_RE = re.compile(r'^0x[0-9A-Fa-f]+: (.*?)(?: \((.*)\))?$')
+BELOW_THRESHOLD = '(below threshold)'
 
 
 class Snapshot:
@@ -14,30 +24,80 @@ class Snapshot:
         return f'snapshot: {self.snapshot}, Total: {self.total}'
 
 
+# Compact time series of the scalar snapshot fields. Every column is an array
+# of 64-bit integers, and the peak is tracked while appending.
+class TimeSeries:
+    def __init__(self):
+        self.time = array('q')
+        self.usefull_heap = array('q')
+        self.extra_heap = array('q')
+        self.stack = array('q')
+        self.peak_index = -1
+        self.peak_total = 0
+
+    def __len__(self):
+        return len(self.time)
+
+    def append(self, time, usefull_heap, extra_heap, stack):
+        total = usefull_heap + extra_heap + stack
+        if self.peak_index == -1 or total > self.peak_total:
+            self.peak_index = len(self.time)
+            self.peak_total = total
+
+        self.time.append(time)
+        self.usefull_heap.append(usefull_heap)
+        self.extra_heap.append(extra_heap)
+        self.stack.append(stack)
+
+    def total(self, i):
+        return self.usefull_heap[i] + self.extra_heap[i] + self.stack[i]
+
+    def snapshot(self, i):
+        return Snapshot(i, self.usefull_heap[i], self.extra_heap[i], self.stack[i])
+
+
 class File:
-    def __init__(self, name, snapshots):
+    def __init__(self, name, series, heap_trees=None):
         self.name = name
-        self.snapshots = snapshots
+        self.series = series
+        # Maps snapshot index to the raw heap_tree lines (only if requested)
+        self.heap_trees = heap_trees if heap_trees is not None else {}
 
     def __str__(self):
         return f'File: {self.name}, Total peak: {self.max_memory()}'
 
+    @property
+    def snapshots(self):
+        return [self.series.snapshot(i) for i in range(len(self.series))]
+
     def max_memory(self):
-        return max([s.total for s in self.snapshots])
+        return self.series.peak_total
+
+    def peak_snapshot(self):
+        return self.series.snapshot(self.series.peak_index)
+
+    def peak_tree(self):
+        return self.heap_trees.get(self.series.peak_index)
+
+
+# Parsed summary of a file, as stored in the parse cache
+class Summary:
+    def __init__(self, summary):
+        self.name = summary['name']
+        self.peak = summary['peak']
+        self.peak_index = summary['peak_index']
+        self.snapshot_count = summary['snapshot_count']
 
+    def __str__(self):
+        return f'File: {self.name}, Total peak: {self.max_memory()}'
+
+    def max_memory(self):
+        return self.peak
 
-def parse_chunk(chunk):
-    lines = chunk.split()
-    assert (lines[0].startswith('snapshot='))
-    assert (lines[3].startswith('mem_heap_B='))
-    assert (lines[4].startswith('mem_heap_extra_B='))
-    assert (lines[5].startswith('mem_stacks_B='))
 
-    snapshot = lines[0].split('=')[1]
-    usefull_heap = lines[3].split('=')[1]
-    extra_heap = lines[4].split('=')[1]
-    stack = lines[5].split('=')[1]
-    return Snapshot(snapshot, usefull_heap, extra_heap, stack)
+def parse_value(line, key):
+    assert (line.startswith(key))
+    return int(line[len(key):])
 
 
 def filepath_to_simple_name(filepath):
@@ -47,29 +107,142 @@ def filepath_to_simple_name(filepath):
     return name
 
 
-def parse_file(filename):
+# Stream the file line by line. Only the scalar fields are kept, heap_tree
+# bodies are skipped unless heap_trees is set. heap_trees is either True for
+# all trees, or the snapshot indices to keep the trees of, where 'peak'
+# keeps the tree of the peak snapshot.
+def parse_file(filename, heap_trees=False):
+    series = TimeSeries()
+    trees = {}
+    tree = None
+    keep_all = heap_trees is True
+    keep = set(heap_trees) if heap_trees and not keep_all else set()
+    keep_peak = 'peak' in keep
+    # Tree of the largest snapshot so far, as (index, lines)
+    peak_tree = None
+
     with open(filename, 'r') as f:
-        content = f.read()
-        delim = 'snapshot'
-        chunks = content.split(delim)
-        chunks = [delim + c for c in chunks[1:]]
-        snapshots = [parse_chunk(c) for c in chunks]
+        for line in f:
+            # Fast path for heap tree bodies
+            c = line[0]
+            if c == 'n' or c == ' ':
+                if tree is not None:
+                    tree.append(line.rstrip('\n'))
+                continue
+            if c == '#':
+                tree = None
+                continue
 
-        name = filepath_to_simple_name(filename)
-        return File(name, snapshots)
+            if line.startswith('snapshot='):
+                assert (parse_value(line, 'snapshot=') == len(series))
+            elif line.startswith('time='):
+                time = parse_value(line, 'time=')
+            elif line.startswith('mem_heap_B='):
+                usefull_heap = parse_value(line, 'mem_heap_B=')
+            elif line.startswith('mem_heap_extra_B='):
+                extra_heap = parse_value(line, 'mem_heap_extra_B=')
+            elif line.startswith('mem_stacks_B='):
+                stack = parse_value(line, 'mem_stacks_B=')
+                series.append(time, usefull_heap, extra_heap, stack)
+            elif line.startswith('heap_tree=') and heap_trees:
+                index = len(series) - 1
+                tree = None
+                if keep_all or index in keep:
+                    tree = []
+                    trees[index] = tree
+                elif keep_peak and index == series.peak_index:
+                    tree = []
+                    peak_tree = (index, tree)
 
+    if peak_tree is not None and peak_tree[0] == series.peak_index:
+        trees[peak_tree[0]] = peak_tree[1]
 
-def parse_folder(dir_path, endswith):
-    files = []
-    for element in os.listdir(dir_path):
+    name = filepath_to_simple_name(filename)
+    return File(name, series, trees)
+
+
+# 'faest_sign (faest.c:284)', without the address and, unless locations is
+# set, the line number. Binaries are shortened to their file name.
+def frame_name(text, locations=False):
+    match = FRAME_RE.match(text)
+    if match is None:
+        return BELOW_THRESHOLD if 'below massif' in text else text
+    function, where = match.groups()
+    if where is None:
+        return function
+    if where.startswith('in '):
+        where = os.path.basename(where[3:])
+    elif not locations:
+        where = where.rpartition(':')[0] or where
+    return f'{function} ({where})'
+
+
+# Call paths of a heap tree as (bytes, frames) with the frames ordered from
+# the allocation site outwards. Every leaf is one path and the bytes of all
+# paths add up to the heap size of the snapshot.
+def heap_tree_paths(lines, locations=False):
+    paths = []
+    stack = []
+    for line in lines:
+        match = TREE_LINE_RE.match(line)
+        if match is None:
+            continue
+        indent, children, size, text = match.groups()
+        depth = len(indent)
+        # The root is the allocation functions themselves
+        del stack[max(depth - 1, 0):]
+        if depth > 0:
+            stack.append(frame_name(text, locations))
+        if children == '0' and depth > 0:
+            paths.append((int(size), tuple(stack)))
+    return paths
+
+
+# Bytes per call path truncated to depth frames, largest first
+def attribute(lines, depth=None, locations=False):
+    totals = {}
+    for size, frames in heap_tree_paths(lines, locations):
+        key = frames[:depth] if depth else frames
+        totals[key] = totals.get(key, 0) + size
+    return sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+
+
+# peak is the largest total, peak_heap and peak_stack are the largest heap
+# (including allocator overhead) and stack on their own
+def summarize_file(filename):
+    f = parse_file(filename)
+    series = f.series
+    heap = (u + e for u, e in zip(series.usefull_heap, series.extra_heap))
+    return {'name': f.name,
+            'peak': f.max_memory(),
+            'peak_index': series.peak_index,
+            'snapshot_count': len(series),
+            'peak_heap': max(heap, default=0),
+            'peak_stack': max(series.stack, default=0)}
+
+
+def list_folder(dir_path, endswith):
+    paths = []
+    for element in sorted(os.listdir(dir_path)):
         path = os.path.join(dir_path, element)
         if not os.path.isfile(path):
             continue
         if not element.endswith(endswith):
             continue
 
-        files.append(parse_file(path))
-    return files
+        paths.append(path)
+    return paths
+
+
+def parse_folder(dir_path, endswith):
+    return [parse_file(path) for path in list_folder(dir_path, endswith)]
+
+
+# Like parse_folder, but only returns summaries. Files are parsed in a process
+# pool and unchanged files are read from the cache.
+def summarize_folder(dir_path, endswith, threads=1, cache=None):
+    paths = list_folder(dir_path, endswith)
+    return [Summary(s) for s in parse_all(paths, summarize_file, threads, cache)]
 
 
 def write_markdown_table(grouped_files, outpath):
@@ -93,13 +266,17 @@ def write_markdown_table(grouped_files, outpath):
                     if f.name == v:
                         wf.write(f' {f.max_memory()//1000:,}kB |')
                         break
+                else:
+                    wf.write(' - |')
             wf.write('\n')
 
 
-def parse_and_write(dir_path, outpath, groups):
+def parse_and_write(dir_path, outpath, groups, threads=1, use_cache=True):
+    cache = ParseCache() if use_cache else None
     grouped_files = []
     for name, endswith in groups:
-        grouped_files.append((name, parse_folder(dir_path, endswith)))
+        grouped_files.append(
+            (name, summarize_folder(dir_path, endswith, threads, cache)))
     write_markdown_table(grouped_files, outpath)
 
 
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# This script is used to parse perf stat output files and create markdown
+# tables of latency, throughput and counters.
+import os
+import re
+import math
+import argparse
+
+from parse_cache import ParseCache, parse_all
+
+TEST_NAMES = ['keygen', 'sign', 'verify']
+
+# Two sided 97.5% quantiles of Student's t distribution for 1..30 degrees of
+# freedom. Above 30 the normal quantile is used.
+T_975 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+         2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+         2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+Z_975 = 1.96
+
+RUNS_RE = re.compile(r'\((\d+) runs\)')
+VARIANCE_RE = re.compile(r'\(\s*\+-\s*([\d.,]+)%\s*\)')
+IPC_RE = re.compile(r'#\s*([\d.,]+)\s+insn per cycle')
+
+
+# Half width of the 95% confidence interval of a mean given its standard error
+def confidence_interval(stderr, n):
+    if n < 2:
+        return float('inf')
+    df = n - 1
+    t = T_975[df - 1] if df <= len(T_975) else Z_975
+    return t * stderr
+
+
+# perf uses the locale for numbers, fx '1.234,56' and '2,02' with a decimal
+# comma or '1,234.56' and '2.02' with a decimal point. The task clock and the
+# elapsed time always have a fractional part, so the last separator in them
+# is the decimal one.
+def detect_decimal(lines):
+    for line in lines:
+        if 'seconds time elapsed' in line or 'msec task-clock' in line:
+            value = line.split()[0]
+            return ',' if value.rfind(',') > value.rfind('.') else '.'
+    return '.'
+
+
+def parse_number(value, decimal):
+    thousands = '.' if decimal == ',' else ','
+    return float(value.replace(thousands, '').replace(decimal, '.'))
+
+
+class Counter:
+    def __init__(self, name, value, rel_stddev):
+        self.name = name
+        self.value = value
+        # Relative standard deviation of the mean in percent, as printed by perf
+        self.rel_stddev = rel_stddev
+
+    def __str__(self):
+        return f'{self.name}: {self.value} (+- {self.rel_stddev}%)'
+
+
+class Stat:
+    def __init__(self, name, runs, counters, elapsed, elapsed_stddev, ipc):
+        self.name = name
+        self.runs = runs
+        self.counters = counters
+        # Mean elapsed time and standard deviation of the mean in seconds
+        self.elapsed = elapsed
+        self.elapsed_stddev = elapsed_stddev
+        self.ipc = ipc
+
+    def __str__(self):
+        return f'Stat: {self.name}, Elapsed: {self.elapsed}s (+- {self.elapsed_stddev}s)'
+
+
+# Blocks of lines, one per perf stat run appended to the file
+def split_blocks(lines):
+    blocks = [[]]
+    for line in lines:
+        if line.lstrip().startswith('Performance counter stats') and blocks[-1]:
+            blocks.append([])
+        blocks[-1].append(line)
+    return blocks
+
+
+def parse_block(lines, decimal):
+    runs = 1
+    counters = {}
+    elapsed = None
+    elapsed_stddev = 0.0
+    ipc = None
+    last = None
+
+    for line in lines:
+        tokens = line.split()
+        if not tokens:
+            continue
+
+        match = RUNS_RE.search(line)
+        if line.lstrip().startswith('Performance counter stats') and match:
+            runs = int(match.group(1))
+            continue
+
+        if 'seconds time elapsed' in line:
+            elapsed = parse_number(tokens[0], decimal)
+            if tokens[1] == '+-':
+                elapsed_stddev = parse_number(tokens[2], decimal)
+            continue
+
+        variance = VARIANCE_RE.search(line)
+
+        # Continuation line with the variance of the previous counter
+        if tokens[0].startswith('#'):
+            if last is not None and variance and last.rel_stddev is None:
+                last.rel_stddev = parse_number(variance.group(1), decimal)
+            continue
+
+        if tokens[0] == '<not':
+            last = None
+            continue
+
+        if not tokens[0][0].isdigit():
+            continue
+
+        value = parse_number(tokens[0], decimal)
+        idx = 2 if tokens[1] == 'msec' else 1
+        if len(tokens) <= idx:
+            continue
+        name = tokens[idx].split(':')[0]
+
+        last = Counter(name, value, None)
+        if variance:
+            last.rel_stddev = parse_number(variance.group(1), decimal)
+        counters[name] = last
+
+        match = IPC_RE.search(line)
+        if match:
+            ipc = parse_number(match.group(1), decimal)
+
+    for c in counters.values():
+        if c.rel_stddev is None:
+            c.rel_stddev = 0.0
+
+    if ipc is None and 'cycles' in counters and 'instructions' in counters:
+        ipc = counters['instructions'].value / counters['cycles'].value
+
+    return Stat(None, runs, counters, elapsed, elapsed_stddev, ipc)
+
+
+# Mean and standard deviation of the mean of the union of (runs, mean,
+# standard deviation of the mean) parts, from the variance within and between
+# the parts
+def pool_means(parts):
+    n = sum(r for r, _, _ in parts)
+    mean = sum(r * m for r, m, _ in parts) / n
+    if n < 2:
+        return mean, 0.0
+    ss = sum((r - 1) * r * s ** 2 + r * (m - mean) ** 2 for r, m, s in parts)
+    return mean, math.sqrt(ss / (n - 1) / n)
+
+
+# Combine the stats of 'perf stat --append' runs into one
+def pool(stats):
+    if len(stats) == 1:
+        return stats[0]
+
+    runs = sum(s.runs for s in stats)
+    counters = {}
+    for name in stats[0].counters:
+        if not all(name in s.counters for s in stats):
+            continue
+        parts = [(s.runs, s.counters[name].value, s.counters[name].rel_stddev / 100 * s.counters[name].value)
+                 for s in stats]
+        value, stddev = pool_means(parts)
+        counters[name] = Counter(name, value, 100 * stddev / value if value else 0.0)
+
+    elapsed, elapsed_stddev = None, 0.0
+    if all(s.elapsed is not None for s in stats):
+        elapsed, elapsed_stddev = pool_means([(s.runs, s.elapsed, s.elapsed_stddev) for s in stats])
+
+    ipc = None
+    if 'cycles' in counters and 'instructions' in counters and counters['cycles'].value:
+        ipc = counters['instructions'].value / counters['cycles'].value
+    return Stat(None, runs, counters, elapsed, elapsed_stddev, ipc)
+
+
+def parse_file(filename):
+    with open(filename, 'r') as f:
+        lines = f.read().splitlines()
+    decimal = detect_decimal(lines)
+
+    stats = [parse_block(b, decimal) for b in split_blocks(lines)]
+    stats = [s for s in stats if s.counters or s.elapsed is not None] or stats[:1]
+    stat = pool(stats)
+
+    name = os.path.basename(filename)
+    if name.startswith('perf_'):
+        name = name[len('perf_'):]
+    stat.name = name
+    return stat
+
+
+def summarize_file(filename):
+    stat = parse_file(filename)
+    return {'name': stat.name,
+            'runs': stat.runs,
+            'counters': {n: {'value': c.value, 'rel_stddev': c.rel_stddev}
+                         for n, c in stat.counters.items()},
+            'elapsed': stat.elapsed,
+            'elapsed_stddev': stat.elapsed_stddev,
+            'ipc': stat.ipc}
+
+
+def list_folder(dir_path):
+    paths = []
+    for element in sorted(os.listdir(dir_path)):
+        path = os.path.join(dir_path, element)
+        if not os.path.isfile(path):
+            continue
+        if not element.startswith('perf_'):
+            continue
+        paths.append(path)
+    return paths
+
+
+def summarize_folder(dir_path, threads=1, cache=None):
+    return parse_all(list_folder(dir_path), summarize_file, threads, cache)
+
+
+def split_name(name):
+    variant, _, operation = name.rpartition('_')
+    return variant, operation
+
+
+# Mean latency in ms and the half width of its 95% confidence interval
+def latency(summary):
+    ci = confidence_interval(summary['elapsed_stddev'], summary['runs'])
+    return 1000 * summary['elapsed'], 1000 * ci
+
+
+# Operations per second with the 95% confidence interval (low, high)
+def throughput(summary):
+    ci = confidence_interval(summary['elapsed_stddev'], summary['runs'])
+    mean = summary['elapsed']
+    low = 1 / (mean + ci)
+    high = 1 / (mean - ci) if mean > ci else math.inf
+    return 1 / mean, low, high
+
+
+def group_by_variant(summaries):
+    grouped = {}
+    for s in summaries:
+        variant, operation = split_name(s['name'])
+        grouped.setdefault(variant, {})[operation] = s
+    variants = sorted(grouped, key=lambda v: (v[-1], v[:-1]))
+    return [(v, grouped[v]) for v in variants]
+
+
+def write_markdown_table(summaries, outpath):
+    grouped = group_by_variant(summaries)
+    header = '| Variant |' + ''.join(f' {t.title()} |' for t in TEST_NAMES)
+    separator = '|:-------:|' + ''.join(f' {len(t) * "-"}:|' for t in TEST_NAMES)
+
+    with open(outpath, 'w') as wf:
+        wf.write('Latency (ms, mean ± 95% CI)\n\n')
+        wf.write(header + '\n')
+        wf.write(separator + '\n')
+        for v, ops in grouped:
+            wf.write(f'| {v} |')
+            for t in TEST_NAMES:
+                if t in ops:
+                    mean, ci = latency(ops[t])
+                    wf.write(f' {mean:,.3f} ± {ci:,.3f} |')
+                else:
+                    wf.write(' - |')
+            wf.write('\n')
+
+        wf.write('\nThroughput (ops/s, 95% CI)\n\n')
+        wf.write(header + '\n')
+        wf.write(separator + '\n')
+        for v, ops in grouped:
+            wf.write(f'| {v} |')
+            for t in TEST_NAMES:
+                if t in ops:
+                    mean, low, high = throughput(ops[t])
+                    wf.write(f' {mean:,.1f} [{low:,.1f}, {high:,.1f}] |')
+                else:
+                    wf.write(' - |')
+            wf.write('\n')
+
+        wf.write('\nCounters (mean ± relative standard deviation)\n\n')
+        wf.write('| Variant | Operation | Runs | Task clock (ms) | Cycles | Instructions | IPC | Branch misses |\n')
+        wf.write('|:-------:|:---------:|-----:|----------------:|-------:|-------------:|----:|--------------:|\n')
+        for v, ops in grouped:
+            for t in TEST_NAMES:
+                if t not in ops:
+                    continue
+                s = ops[t]
+                wf.write(f'| {v} | {t} | {s["runs"]} |')
+                for e in ['task-clock', 'cycles', 'instructions']:
+                    c = s['counters'].get(e)
+                    if c is None:
+                        wf.write(' - |')
+                    elif e == 'task-clock':
+                        wf.write(f' {c["value"]:,.2f} ± {c["rel_stddev"]:.2f}% |')
+                    else:
+                        wf.write(f' {c["value"]:,.0f} ± {c["rel_stddev"]:.2f}% |')
+                wf.write(f' {s["ipc"]:.2f} |' if s['ipc'] is not None else ' - |')
+                c = s['counters'].get('branch-misses')
+                wf.write(f' {c["value"]:,.0f} ± {c["rel_stddev"]:.2f}% |\n' if c else ' - |\n')
+
+
+def parse_and_write(dir_path, outpath, threads=1, use_cache=True):
+    cache = ParseCache() if use_cache else None
+    write_markdown_table(summarize_folder(dir_path, threads, cache), outpath)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Create latency, throughput and counter tables from perf stat files.')
+
+    parser.add_argument('folder', help='Folder with perf_* files')
+    parser.add_argument('-o', '--output', default='perf.md',
+                        help='Output markdown file (default: perf.md)')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='Process count. Set to 0 for max utilization (default: 1)')
+    parser.add_argument('--no-cache', action='store_true', default=False,
+                        help='Do not use the parse cache')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    parse_and_write(args.folder, args.output, args.threads, not args.no_cache)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# This script is used to fold the call graph samples of perf record data
+# (faest_test.py --tool perf-record) into flame graph ready folded stacks,
+# and to render them as SVG flame graphs.
+import os
+import re
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# '\t    7f0a1b2c3d4e aes_encrypt+0x1e (/usr/lib/libfaest.so)'
+FRAME_RE = re.compile(r'^\s*([0-9a-fA-F]+) (.*) \((.*)\)$')
+OFFSET_RE = re.compile(r'\+0x[0-9a-fA-F]+$')
+
+SVG_WIDTH = 1200
+FRAME_HEIGHT = 16
+# Frames narrower than this many pixels are not drawn
+MIN_WIDTH = 0.1
+
+
+def frame_symbol(line):
+    match = FRAME_RE.match(line)
+    if match is None:
+        return None
+    _, symbol, dso = match.groups()
+    symbol = OFFSET_RE.sub('', symbol)
+    if symbol == '[unknown]':
+        return f'[{os.path.basename(dso)}]'
+    return symbol
+
+
+# Fold the output of 'perf script' into {'comm;root;...;leaf': samples}
+def fold_lines(lines):
+    folded = {}
+    comm = None
+    frames = []
+    for line in lines:
+        line = line.rstrip('\n')
+        if line.startswith('\t'):
+            symbol = frame_symbol(line)
+            if symbol is not None:
+                frames.append(symbol)
+            continue
+        if comm is not None:
+            stack = ';'.join([comm] + frames[::-1])
+            folded[stack] = folded.get(stack, 0) + 1
+            comm = None
+        if line.strip():
+            comm = line.split()[0]
+            frames = []
+    if comm is not None:
+        stack = ';'.join([comm] + frames[::-1])
+        folded[stack] = folded.get(stack, 0) + 1
+    return folded
+
+
+# Returns None and the perf output on failure
+def fold_data(data_path):
+    process = subprocess.run(['perf', 'script', '-i', data_path, '-F', 'comm,ip,sym,dso'],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors='replace')
+    if process.returncode != 0:
+        return None, process.stderr
+    return fold_lines(process.stdout.splitlines()), None
+
+
+def write_folded(folded, outpath):
+    with open(outpath, 'w') as wf:
+        for stack, count in sorted(folded.items()):
+            wf.write(f'{stack} {count}\n')
+
+
+def read_folded(filename):
+    folded = {}
+    with open(filename, 'r') as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                folded[stack] = folded.get(stack, 0) + int(count)
+    return folded
+
+
+class Frame:
+    def __init__(self, name):
+        self.name = name
+        self.samples = 0
+        self.children = {}
+
+
+def build_tree(folded):
+    root = Frame('all')
+    for stack, count in folded.items():
+        node = root
+        node.samples += count
+        for name in stack.split(';'):
+            node = node.children.setdefault(name, Frame(name))
+            node.samples += count
+    return root
+
+
+# Warm colors, stable per function name
+def frame_color(name):
+    h = 0
+    for c in name:
+        h = (h * 31 + ord(c)) & 0xffffffff
+    return f'rgb({205 + h % 50},{(h >> 8) % 180},{(h >> 16) % 55})'
+
+
+def escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+def max_depth(node):
+    return 1 + max((max_depth(c) for c in node.children.values()), default=0)
+
+
+# Icicle layout turned upside down: the root at the bottom, callees on top
+def write_svg(folded, outpath, title):
+    root = build_tree(folded)
+    height = (max_depth(root) + 2) * FRAME_HEIGHT
+    scale = SVG_WIDTH / root.samples if root.samples else 0
+
+    rects = []
+
+    def draw(node, x, depth):
+        width = node.samples * scale
+        if width < MIN_WIDTH:
+            return
+        y = height - (depth + 1) * FRAME_HEIGHT
+        percent = 100 * node.samples / root.samples
+        label = escape(node.name)
+        text = label if width > 7 * len(node.name) else ''
+        rects.append(f'<g><title>{label} ({node.samples:,} samples, {percent:.2f}%)</title>'
+                     f'<rect x="{x:.2f}" y="{y}" width="{width:.2f}" height="{FRAME_HEIGHT - 1}"'
+                     f' fill="{frame_color(node.name)}"/>'
+                     f'<text x="{x + 3:.2f}" y="{y + FRAME_HEIGHT - 4}">{text}</text></g>')
+        for child in sorted(node.children.values(), key=lambda c: c.name):
+            draw(child, x, depth + 1)
+            x += child.samples * scale
+
+    if root.samples:
+        draw(root, 0, 0)
+
+    with open(outpath, 'w') as wf:
+        wf.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{SVG_WIDTH}" height="{height}"'
+                 f' font-family="monospace" font-size="11">\n')
+        wf.write(f'<text x="{SVG_WIDTH / 2}" y="{FRAME_HEIGHT}" text-anchor="middle"'
+                 f' font-size="14">{escape(title)}</text>\n')
+        wf.write('\n'.join(rects))
+        wf.write('\n</svg>\n')
+
+
+def list_folder(dir_path):
+    paths = []
+    for element in sorted(os.listdir(dir_path)):
+        path = os.path.join(dir_path, element)
+        if os.path.isfile(path) and element.endswith('.data'):
+            paths.append(path)
+    return paths
+
+
+# Write <name>.folded and <name>.svg next to every <name>.data file. Returns
+# the data files perf could not read, with its error output.
+def fold_folder(dir_path, threads=1):
+    paths = list_folder(dir_path)
+    with ThreadPoolExecutor(max_workers=max(threads, 1)) as executor:
+        results = list(executor.map(fold_data, paths))
+
+    failed = []
+    for path, (folded, error) in zip(paths, results):
+        if folded is None:
+            failed.append((path, error))
+            continue
+        base = path[:-len('.data')]
+        write_folded(folded, f'{base}.folded')
+        write_svg(folded, f'{base}.svg', os.path.basename(base))
+    return failed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Fold perf record data into folded stacks and SVG flame graphs.')
+
+    parser.add_argument('paths', nargs='+',
+                        help='Folders with .data files, or .folded files to render again')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='Thread count. Set to 0 for max utilization (default: 1)')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    threads = args.threads if args.threads > 0 else os.cpu_count()
+
+    failed = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            failed += fold_folder(path, threads)
+        else:
+            base = path[:-len('.folded')] if path.endswith('.folded') else path
+            write_svg(read_folded(path), f'{base}.svg', os.path.basename(base))
+
+    for path, error in failed:
+        print(f'perf script failed on {path}')
+        print(error, end='')
+    exit(1 if failed else 0)
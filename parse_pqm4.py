@@ -0,0 +1,86 @@
+# This script is used to parse the output of the pqm4 speed and stack
+# benchmarks (pqm4_bench.py) and create a markdown table per variant and
+# operation like the host results.
+import os
+import re
+
+import parse_bench
+
+# 'keypair cycles:' or 'sign stack usage:', the value follows on the next line
+REPORT_RE = re.compile(r'^(keypair|sign|verify) (cycles|stack usage):$')
+
+OPERATIONS = {'keypair': 'keygen', 'sign': 'sign', 'verify': 'verify'}
+METRICS = {'cycles': 'cycles', 'stack usage': 'stack'}
+
+# Benchmarks and the prefix of their output files, fx speed_EM128f
+BENCHMARKS = ['speed', 'stack']
+
+
+# Maps (operation, metric) to the reported values. Schemes that report more
+# than once per operation get a value per report.
+def parse_lines(lines):
+    values = {}
+    pending = None
+    for line in lines:
+        line = line.strip()
+        if pending is not None:
+            if line.isdigit():
+                values.setdefault(pending, []).append(int(line))
+            pending = None
+            continue
+        match = REPORT_RE.match(line)
+        if match:
+            pending = (OPERATIONS[match.group(1)], METRICS[match.group(2)])
+    return values
+
+
+# Whether the benchmark got to the end ('#')
+def finished(lines):
+    return any(line.strip() == '#' for line in lines)
+
+
+def parse_file(filename):
+    with open(filename, 'r', errors='replace') as f:
+        return parse_lines(f.readlines())
+
+
+def median(values):
+    return parse_bench.percentile(sorted(values), 50)
+
+
+# {(variant, operation): {metric: value}} of the benchmark outputs in dir_path
+def parse_folder(dir_path):
+    results = {}
+    for element in sorted(os.listdir(dir_path)):
+        path = os.path.join(dir_path, element)
+        benchmark, _, variant = element.partition('_')
+        if not os.path.isfile(path) or benchmark not in BENCHMARKS or not variant:
+            continue
+        for (operation, metric), values in parse_file(path).items():
+            results.setdefault((variant, operation), {})[metric] = median(values)
+    return results
+
+
+def sort_key(key):
+    return parse_bench.sort_key({'name': '_'.join(key)})
+
+
+def write_markdown_table(results, outpath, title=None):
+    with open(outpath, 'w') as wf:
+        if title:
+            wf.write(f'# {title}\n\n')
+        wf.write('| Variant | Operation | Cycles | Stack (B) |\n')
+        wf.write('|:-------:|:---------:|-------:|----------:|\n')
+        for key in sorted(results, key=sort_key):
+            r = results[key]
+            wf.write(f'| {key[0]} | {key[1]} | {parse_bench.format_count(r.get("cycles"))} |'
+                     f' {parse_bench.format_count(r.get("stack"))} |\n')
+
+
+def parse_and_write(dir_path, outpath, title=None):
+    write_markdown_table(parse_folder(dir_path), outpath, title)
+
+
+if __name__ == '__main__':
+    print('This script should not be run directly')
+    exit(1)
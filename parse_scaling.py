@@ -0,0 +1,159 @@
+# This script is used to parse the results of the message length sweep
+# (faest_test.py --scaling) and create scaling curves per variant.
+import os
+import re
+
+import parse_bench
+import parse_massif
+
+MSG_FOLDER_RE = re.compile(r'^msg-(\d+)$')
+
+# Message dependent share of the cost from which hashing the message matters
+HASH_SHARE_THRESHOLD = 0.1
+
+CSV_COLUMNS = ['variant', 'operation', 'msg_len', 'median_ns', 'median_cycles',
+               'median_instructions', 'peak_heap', 'peak_stack']
+
+
+class Point:
+    def __init__(self, msg_len):
+        self.msg_len = msg_len
+        self.median_ns = None
+        self.median_cycles = None
+        self.median_instructions = None
+        self.peak_heap = None
+        self.peak_stack = None
+
+    def cost(self):
+        # Instructions are the least noisy, wall time is always there
+        for value in (self.median_instructions, self.median_cycles, self.median_ns):
+            if value is not None:
+                return value
+        return None
+
+
+# Message length folders of a sweep, sorted by length
+def list_lengths(dir_path):
+    lengths = []
+    for element in os.listdir(dir_path):
+        match = MSG_FOLDER_RE.match(element)
+        if match:
+            lengths.append((int(match.group(1)), os.path.join(dir_path, element)))
+    return sorted(lengths)
+
+
+def point(curves, name, msg_len):
+    variant, _, operation = name.rpartition('_')
+    points = curves.setdefault((variant, operation), {})
+    return points.setdefault(msg_len, Point(msg_len))
+
+
+# Maps (variant, operation) to its points sorted by message length
+def collect(dir_path):
+    curves = {}
+    for msg_len, path in list_lengths(dir_path):
+        bench_path = os.path.join(path, 'bench')
+        if os.path.isdir(bench_path):
+            for s in parse_bench.parse_folder(bench_path):
+                if not s['iterations']:
+                    continue
+                p = point(curves, s['name'], msg_len)
+                p.median_ns = s['median_ns']
+                p.median_cycles = s['median_cycles']
+                p.median_instructions = s['median_instructions']
+
+        massif_path = os.path.join(path, 'massif')
+        if os.path.isdir(massif_path):
+            for element in sorted(os.listdir(massif_path)):
+                p = point(curves, element, msg_len)
+                s = parse_massif.summarize_file(os.path.join(massif_path, element))
+                p.peak_heap, p.peak_stack = s['peak_heap'], s['peak_stack']
+
+    return {key: [points[n] for n in sorted(points)] for key, points in curves.items()}
+
+
+# Share of the cost at each point that is caused by the message, taking the
+# shortest message as the message independent (VOLE, AES, ...) cost
+def message_shares(points):
+    base = points[0].cost() if points else None
+    shares = []
+    for p in points:
+        cost = p.cost()
+        if base is None or not cost:
+            shares.append(None)
+        else:
+            shares.append(max(cost - base, 0) / cost)
+    return shares
+
+
+# Shortest message length where the message dependent share reaches threshold
+def crossover(points, threshold=HASH_SHARE_THRESHOLD):
+    for p, share in zip(points, message_shares(points)):
+        if share is not None and share >= threshold:
+            return p.msg_len
+    return None
+
+
+def sort_key(key):
+    variant, operation = key
+    op = parse_bench.TEST_NAMES.index(operation) if operation in parse_bench.TEST_NAMES else len(parse_bench.TEST_NAMES)
+    return (variant[-1], variant[:-1], op)
+
+
+def format_bytes(n):
+    for unit in ('B', 'KiB'):
+        if n < 1024:
+            return f'{n:g} {unit}'
+        n /= 1024
+    return f'{n:g} MiB'
+
+
+def format_value(value, scale=1, digits=0):
+    return f'{value / scale:,.{digits}f}' if value is not None else '-'
+
+
+def write_csv(curves, outpath):
+    with open(outpath, 'w') as wf:
+        wf.write(','.join(CSV_COLUMNS) + '\n')
+        for key in sorted(curves, key=sort_key):
+            for p in curves[key]:
+                values = [p.median_ns, p.median_cycles, p.median_instructions,
+                          p.peak_heap, p.peak_stack]
+                wf.write(','.join([*key, str(p.msg_len)] +
+                                  ['' if v is None else f'{v:.0f}' for v in values]) + '\n')
+
+
+def write_markdown(curves, outpath, threshold=HASH_SHARE_THRESHOLD):
+    with open(outpath, 'w') as wf:
+        wf.write('# Message length scaling\n\n')
+        wf.write(f'Hashing the message matters from the shortest length where it makes up at least'
+                 f' {threshold:.0%} of the cost (instructions if measured, otherwise cycles or time).'
+                 ' Peak heap includes the message buffers of the harness.\n\n')
+
+        wf.write('| Variant | Operation | Hashing matters from |\n')
+        wf.write('|:-------:|:---------:|---------------------:|\n')
+        for key in sorted(curves, key=sort_key):
+            n = crossover(curves[key], threshold)
+            wf.write(f'| {key[0]} | {key[1]} | {format_bytes(n) if n is not None else "-"} |\n')
+
+        for key in sorted(curves, key=sort_key):
+            points = curves[key]
+            wf.write(f'\n## {key[0]} {key[1]}\n\n')
+            wf.write('| Message | Median (ms) | Cycles | Instructions | Message share | Peak heap (B) | Peak stack (B) |\n')
+            wf.write('|--------:|------------:|-------:|-------------:|--------------:|--------------:|---------------:|\n')
+            for p, share in zip(points, message_shares(points)):
+                share = f'{share:.1%}' if share is not None else '-'
+                wf.write(f'| {format_bytes(p.msg_len)} | {format_value(p.median_ns, 1e6, 3)} |'
+                         f' {format_value(p.median_cycles)} | {format_value(p.median_instructions)} |'
+                         f' {share} | {format_value(p.peak_heap)} | {format_value(p.peak_stack)} |\n')
+
+
+def parse_and_write(dir_path, md_path, csv_path):
+    curves = collect(dir_path)
+    write_markdown(curves, md_path)
+    write_csv(curves, csv_path)
+
+
+if __name__ == '__main__':
+    print('This script should not be run directly')
+    exit(1)
@@ -0,0 +1,88 @@
+# This script is used to parse the output of the stack painting mode
+# (faest_test.py --stack) and create a markdown table, with the massif peak
+# stack of the cross-checked variants next to it.
+import os
+
+import parse_bench
+import parse_massif
+from compare_results import split_result_name
+
+# Allowed difference to massif. massif also counts the frames of main and
+# the C runtime, and the painting misses stack buffers that are never written.
+CHECK_TOLERANCE = 4096
+
+
+def parse_file(filename):
+    with open(filename, 'r') as f:
+        values = f.read().split()
+    return int(values[0]) if values else None
+
+
+def summarize_file(filename):
+    # stack_<variant>_<operation>
+    name = os.path.basename(filename)
+    if name.startswith('stack_'):
+        name = name[len('stack_'):]
+    return {'name': name, 'peak_stack': parse_file(filename)}
+
+
+# {(variant, operation): peak stack} of the stack_* files in dir_path
+def parse_folder(dir_path):
+    results = {}
+    for element in sorted(os.listdir(dir_path)):
+        path = os.path.join(dir_path, element)
+        if not os.path.isfile(path) or not element.startswith('stack_'):
+            continue
+        s = summarize_file(path)
+        key = split_result_name(s['name'])
+        if key is not None and s['peak_stack'] is not None:
+            results[key] = s['peak_stack']
+    return results
+
+
+# {(variant, operation): peak stack} of the massif files in dir_path
+def parse_massif_folder(dir_path):
+    results = {}
+    if not os.path.isdir(dir_path):
+        return results
+    for element in sorted(os.listdir(dir_path)):
+        key = split_result_name(element)
+        if key is not None:
+            results[key] = parse_massif.summarize_file(os.path.join(dir_path, element))['peak_stack']
+    return results
+
+
+def matches(painted, massif, tolerance=CHECK_TOLERANCE):
+    return abs(painted - massif) <= tolerance
+
+
+def sort_key(key):
+    return parse_bench.sort_key({'name': '_'.join(key)})
+
+
+def write_markdown_table(painted, massif, outpath, tolerance=CHECK_TOLERANCE):
+    with open(outpath, 'w') as wf:
+        wf.write('| Variant | Operation | Peak stack (B) | massif (B) | Difference (B) |\n')
+        wf.write('|:-------:|:---------:|---------------:|-----------:|---------------:|\n')
+        for key in sorted(painted, key=sort_key):
+            value = painted[key]
+            if key in massif:
+                check = f'{massif[key]:,} | {value - massif[key]:+,}{"" if matches(value, massif[key], tolerance) else " (!)"}'
+            else:
+                check = '- | -'
+            wf.write(f'| {key[0]} | {key[1]} | {value:,} | {check} |\n')
+        if any(not matches(painted[k], massif[k], tolerance) for k in painted if k in massif):
+            wf.write(f'\n(!) differs from massif by more than {tolerance:,} B\n')
+
+
+# Returns the keys that differ from massif by more than the tolerance
+def parse_and_write(dir_path, massif_path, outpath):
+    painted = parse_folder(dir_path)
+    massif = parse_massif_folder(massif_path)
+    write_markdown_table(painted, massif, outpath)
+    return [k for k in sorted(painted, key=sort_key) if k in massif and not matches(painted[k], massif[k])]
+
+
+if __name__ == '__main__':
+    print('This script should not be run directly')
+    exit(1)
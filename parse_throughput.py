@@ -0,0 +1,88 @@
+# This script is used to parse the output of the throughput mode
+# (faest_test.py --throughput) and create a markdown table.
+import os
+
+import parse_bench
+
+
+class Run:
+    def __init__(self, name, workers, spans):
+        self.name = name
+        self.workers = workers
+        # (start_ns, end_ns, ops) of every worker
+        self.spans = spans
+
+    def ops(self):
+        return sum(ops for _, _, ops in self.spans)
+
+    # Aggregate ops/s from the first worker starting to the last one finishing
+    def ops_per_second(self):
+        start = min(s for s, _, _ in self.spans)
+        end = max(e for _, e, _ in self.spans)
+        return 1e9 * self.ops() / (end - start) if end > start else None
+
+
+def parse_file(filename):
+    spans = []
+    with open(filename, 'r') as f:
+        for line in f:
+            values = line.split()
+            if values:
+                spans.append(tuple(int(v) for v in values))
+
+    # throughput_<variant>_<operation>_<workers>
+    name, _, workers = os.path.basename(filename).rpartition('_')
+    if name.startswith('throughput_'):
+        name = name[len('throughput_'):]
+    return Run(name, int(workers), spans)
+
+
+def summarize_file(filename):
+    run = parse_file(filename)
+    return {'name': run.name,
+            'workers': run.workers,
+            'ops': run.ops(),
+            'ops_per_second': run.ops_per_second()}
+
+
+# Maps variant_operation to its runs sorted by worker count
+def parse_folder(dir_path):
+    runs = {}
+    for element in sorted(os.listdir(dir_path)):
+        path = os.path.join(dir_path, element)
+        if not os.path.isfile(path) or not element.startswith('throughput_'):
+            continue
+        run = parse_file(path)
+        runs.setdefault(run.name, []).append(run)
+    return {name: sorted(r, key=lambda run: run.workers) for name, r in runs.items()}
+
+
+# Speedup and efficiency are relative to the smallest worker count, so a
+# perfectly scaling operation has an efficiency of 100%
+def write_markdown_table(runs, outpath):
+    with open(outpath, 'w') as wf:
+        wf.write('| Variant | Operation | Workers | ops/s | ops/s per worker | Speedup | Efficiency |\n')
+        wf.write('|:-------:|:---------:|--------:|------:|-----------------:|--------:|-----------:|\n')
+        for name in sorted(runs, key=lambda n: parse_bench.sort_key({'name': n})):
+            variant, _, operation = name.rpartition('_')
+            base = None
+            for run in runs[name]:
+                throughput = run.ops_per_second()
+                if throughput is None:
+                    continue
+                if base is None:
+                    base = run
+                    base_throughput = throughput
+                speedup = throughput / base_throughput * base.workers
+                wf.write(f'| {variant} | {operation} | {run.workers} | {throughput:,.1f} |'
+                         f' {throughput / run.workers:,.1f} | {speedup:.2f} |'
+                         f' {speedup / run.workers:.0%} |\n')
+
+
+def parse_and_write(dir_path, outpath):
+    write_markdown_table(parse_folder(dir_path), outpath)
+
+
+if __name__ == '__main__':
+    print('This script should not be run directly')
+    exit(1)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# This script benchmarks the variants exported to pqm4 (faest_to_pqm4.py) on
+# an emulated Cortex-M4. The speed and stack benchmarks of the *_masked/m4
+# schemes are built for a QEMU platform and run there, and their cycle and
+# stack reports are tabulated and stored like the host results.
+import os
+import shutil
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import parse_pqm4
+import results_store
+from faest_to_pqm4 import all as SCHEMES
+from faest_test import simplify_name
+
+FILEPATH = os.path.dirname(os.path.realpath(__file__))
+PQM4_PATH = f'{FILEPATH}/pqm4'
+TEST_RESULT_PATH = f'{FILEPATH}/test/results'
+TEST_RESULT_PQM4_PATH = f'{TEST_RESULT_PATH}/pqm4'
+
+CROSS_COMPILER = 'arm-none-eabi-gcc'
+QEMU = 'qemu-system-arm'
+
+# QEMU machine of the pqm4 platforms that can be emulated
+QEMU_MACHINES = {'mps2-an386': 'mps2-an386'}
+PLATFORM = 'mps2-an386'
+
+# Ties the virtual clock to the executed instructions, so the cycle counts
+# are deterministic. They are not those of a real M4 (no wait states or
+# pipeline), but changes between runs are.
+QEMU_ICOUNT = 'shift=0'
+
+# Seconds before a benchmark is killed, the s variants are slow under emulation
+TIMEOUT = 3600
+
+
+def elf_path(scheme, benchmark):
+    return f'bin/crypto_sign_{scheme}_masked_m4_{benchmark}.elf'
+
+
+# Build the benchmarks of all schemes with a single parallel make, so pqm4's
+# common objects are only built once. Returns None on success, otherwise the
+# output of make.
+def build(pqm4_path, schemes, platform, threads):
+    targets = [elf_path(s, b) for s in schemes for b in parse_pqm4.BENCHMARKS]
+    cmd = ['make', f'-j{threads}', f'PLATFORM={platform}', *targets]
+    try:
+        process = subprocess.run(cmd, cwd=pqm4_path, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    except FileNotFoundError:
+        return 'make not found\n'
+    if process.returncode != 0:
+        return process.stdout
+    return None
+
+
+# Run an ELF until it prints the end marker ('#') and write its output to
+# outpath. The benchmarks loop forever when done, so QEMU is killed then.
+# Returns whether the benchmark finished.
+def run_elf(elf, machine, outpath, timeout):
+    cmd = [QEMU, '-M', machine, '-nographic', '-semihosting', '-icount', QEMU_ICOUNT, '-kernel', elf]
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors='replace')
+    except FileNotFoundError:
+        return False
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+
+    lines = []
+    with open(outpath, 'w') as out:
+        for line in process.stdout:
+            out.write(line)
+            lines.append(line)
+            if line.strip() == '#':
+                break
+
+    timer.cancel()
+    process.kill()
+    process.wait()
+    return parse_pqm4.finished(lines)
+
+
+def run_all(pqm4_path, schemes, machine, threads, timeout):
+    jobs = [(s, b) for s in schemes for b in parse_pqm4.BENCHMARKS]
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(run_elf, f'{pqm4_path}/{elf_path(s, b)}', machine,
+                                   f'{TEST_RESULT_PQM4_PATH}/{b}_{simplify_name(s)}', timeout)
+                   for s, b in jobs]
+        return [job for job, f in zip(jobs, futures) if not f.result()]
+
+
+def records(results):
+    return [(variant, operation, 'pqm4', metric, value, None, None)
+            for (variant, operation), values in results.items()
+            for metric, value in values.items()]
+
+
+def run_metadata(args):
+    commit = results_store.git_commit(f'{FILEPATH}/faest') or results_store.git_commit(FILEPATH)
+    return {'label': args.label or f'{args.platform} (QEMU)',
+            'mode': 'pqm4',
+            'commit_hash': commit,
+            'host': f'QEMU {QEMU_MACHINES[args.platform]} on {results_store.host_info()}',
+            'compiler': results_store.compiler_version(CROSS_COMPILER),
+            'openssl': 0,
+            'args': {'platform': args.platform, 'schemes': args.schemes, 'icount': QEMU_ICOUNT}}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Build the pqm4 speed and stack benchmarks and run them on an emulated Cortex-M4.')
+
+    parser.add_argument('schemes', nargs='*',
+                        help='Schemes, fx faest_128f. If empty, all are run')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='Thread count. Set to 0 for max utilization (default: 1)')
+    parser.add_argument('--pqm4', default=PQM4_PATH,
+                        help=f'pqm4 tree (default: {os.path.relpath(PQM4_PATH)})')
+    parser.add_argument('--platform', choices=list(QEMU_MACHINES), default=PLATFORM,
+                        help=f'pqm4 platform (default: {PLATFORM})')
+    parser.add_argument('--timeout', type=int, default=TIMEOUT,
+                        help=f'Seconds before a benchmark is killed (default: {TIMEOUT})')
+    parser.add_argument('--no-build', action='store_true', default=False,
+                        help='Run the already built benchmarks')
+    parser.add_argument('--label', default=None,
+                        help='Label of the run in the results store (default: the platform)')
+
+    args = parser.parse_args()
+    for scheme in args.schemes:
+        if scheme not in SCHEMES:
+            parser.error(f'{scheme} is not a valid scheme. Only {SCHEMES} may be used')
+    args.schemes = args.schemes or SCHEMES
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    threads = args.threads if args.threads > 0 else os.cpu_count()
+
+    if shutil.which(QEMU) is None:
+        print(f'{QEMU} not found')
+        exit(1)
+
+    if not args.no_build:
+        print(f'Building {len(args.schemes)} scheme(s) for {args.platform}')
+        output = build(args.pqm4, args.schemes, args.platform, threads)
+        if output is not None:
+            print('error building pqm4 benchmarks')
+            print(output, end='')
+            exit(1)
+
+    print('Removing old results')
+    shutil.rmtree(TEST_RESULT_PQM4_PATH, ignore_errors=True)
+    os.makedirs(TEST_RESULT_PQM4_PATH)
+
+    print(f'Running benchmarks ({threads} thread(s))')
+    failed = run_all(args.pqm4, args.schemes, QEMU_MACHINES[args.platform], threads, args.timeout)
+    for scheme, benchmark in failed:
+        print(f'{benchmark} with {scheme} did not finish')
+
+    results = parse_pqm4.parse_folder(TEST_RESULT_PQM4_PATH)
+    parse_pqm4.write_markdown_table(results, f'{TEST_RESULT_PATH}/pqm4.md', f'pqm4 on {args.platform} (QEMU)')
+    print(f'Wrote {TEST_RESULT_PATH}/pqm4.md')
+
+    if results:
+        run_id = results_store.store_run(run_metadata(args), records(results))
+        print(f'Stored results as run {run_id} in {results_store.STORE_PATH}')
+
+    exit(1 if failed else 0)
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# Compare the sliding window recomputation model of
+# accessPatternToRecomputation.py against other cache replacement policies.
+#
+# cache_size is an index like in compute_recomputation, so a cache of
+# cache_size holds cache_size + 1 elements. The window models count
+# recomputed windows. The element caches (lru, fifo, min) count runs of
+# misses, since elements are generated in increasing order: a miss on the
+# element right after the previously missed element continues the same
+# recomputation. The first computation of the elements is included.
+import os
+import heapq
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from accessPatternToRecomputation import (MIN_OLES, PARAMETERS, RECOMP_PATH, build_range_tables,
+                                          compute_recomputation_curve, curve_cache_sizes,
+                                          find_largest, load_trace, next_miss, trace_variant)
+
+WINDOWS = 2
+
+
+# Misses of an LRU cache for all sizes in one pass (Mattson's stack
+# algorithm). The stack distance of every access is found with a Fenwick
+# tree over the time of the last access to every element.
+def lru_curve(data, cache_sizes, l):
+    n = len(data)
+    tree = [0] * (n + 1)
+
+    def add(i, v):
+        i += 1
+        while i <= n:
+            tree[i] += v
+            i += i & -i
+
+    def prefix(i):
+        s = 0
+        while i > 0:
+            s += tree[i]
+            i -= i & -i
+        return s
+
+    # Stack distance of every access, cold misses have distance n + 2, more
+    # than any capacity that makes a difference
+    last = {}
+    dist = [0] * n
+    for t, x in enumerate(data):
+        p = last.get(x)
+        if p is None:
+            dist[t] = n + 2
+        else:
+            # Distinct elements accessed since the last access to x, plus x
+            dist[t] = prefix(t) - prefix(p + 1) + 1
+            add(p, -1)
+        add(t, 1)
+        last[x] = t
+
+    # An access misses if its distance is above the capacity. Two
+    # consecutive misses in a run only start one recomputation.
+    hist = [0] * (n + 3)
+    for t in range(n):
+        hist[dist[t]] += 1
+        if t > 0 and data[t] == data[t - 1] + 1:
+            hist[min(dist[t], dist[t - 1])] -= 1
+
+    # runs[d] = recomputations with a capacity of d elements
+    runs = [0] * (n + 3)
+    for d in range(n + 1, -1, -1):
+        runs[d] = runs[d + 1] + hist[d + 1]
+    return [runs[min(c + 1, n + 1)] for c in cache_sizes]
+
+
+def fifo_recomputation(data, cache_size):
+    capacity = cache_size + 1
+    cache = set()
+    order = deque()
+    recomputation = 0
+    previous = None
+    for x in data:
+        if x in cache:
+            previous = None
+            continue
+        if previous is None or x != previous + 1:
+            recomputation += 1
+        previous = x
+        if len(cache) == capacity:
+            cache.remove(order.popleft())
+        cache.add(x)
+        order.append(x)
+    return recomputation
+
+
+def fifo_curve(data, cache_sizes, l):
+    return [fifo_recomputation(data, c) for c in cache_sizes]
+
+
+# For every access, the time of the next access to the same element
+def next_uses(data):
+    nxt = [0] * len(data)
+    seen = {}
+    for t in range(len(data) - 1, -1, -1):
+        nxt[t] = seen.get(data[t], len(data))
+        seen[data[t]] = t
+    return nxt
+
+
+# Belady's MIN, evicts the element used furthest in the future. Uses a max
+# heap with lazy deletion, so it is O(n log n) per cache size.
+def min_recomputation(data, nxt, cache_size):
+    capacity = cache_size + 1
+    current = {}
+    heap = []
+    recomputation = 0
+    previous = None
+    for t, x in enumerate(data):
+        if x in current:
+            previous = None
+        else:
+            if previous is None or x != previous + 1:
+                recomputation += 1
+            previous = x
+            if len(current) == capacity:
+                while True:
+                    use, y = heapq.heappop(heap)
+                    if current.get(y) == -use:
+                        del current[y]
+                        break
+        current[x] = nxt[t]
+        heapq.heappush(heap, (-nxt[t], x))
+    return recomputation
+
+
+def min_curve(data, cache_sizes, l):
+    nxt = next_uses(data)
+    return [min_recomputation(data, nxt, c) for c in cache_sizes]
+
+
+def window_curve(data, cache_sizes, l):
+    return compute_recomputation_curve(data, cache_sizes, l)
+
+
+# Window start after a miss on x, same heuristic as compute_recomputation
+def anchor(x, size, largest, l):
+    if (x > l):
+        return x - size
+    elif (x + size < largest):
+        return x
+    else:
+        return largest - size
+
+
+# Like the sliding window, but the cache is split into windows windows. On a
+# miss the least recently used window is moved.
+def multi_window_recomputation(data, cache_size, largest, l, windows=WINDOWS):
+    size = (cache_size + 1) // windows - 1
+    if size < 0:
+        return None
+    starts = [0] + [None] * (windows - 1)
+    used = list(range(windows))
+
+    recomputation = 1
+    for x in data:
+        for w in used:
+            s = starts[w]
+            if s is not None and s <= x <= s + size:
+                break
+        else:
+            recomputation += 1
+            w = used[-1]
+            starts[w] = anchor(x, size, largest, l)
+        # Move w to the front of the recency list
+        if used[0] != w:
+            used.remove(w)
+            used.insert(0, w)
+    return recomputation
+
+
+def multi_window_curve(data, cache_sizes, l):
+    largest = find_largest(data)
+    return [multi_window_recomputation(data, c, largest, l) for c in cache_sizes]
+
+
+# The index space is split into aligned segments of cache_size + 1 elements
+# and the segment of the accessed element is computed on a miss
+def segmented_curve(data, cache_sizes, l):
+    mins, maxs = build_range_tables(data)
+    curve = []
+    for c in cache_sizes:
+        length = c + 1
+        low = 0
+        recomputation = 1
+        i = next_miss(mins, maxs, 0, low, low + c)
+        while i < len(data):
+            recomputation += 1
+            low = data[i] // length * length
+            i = next_miss(mins, maxs, i + 1, low, low + c)
+        curve.append(recomputation)
+    return curve
+
+
+POLICIES = {'window': window_curve,
+            'multi-window': multi_window_curve,
+            'segmented': segmented_curve,
+            'lru': lru_curve,
+            'fifo': fifo_curve,
+            'min': min_curve}
+
+# Policies that cache single elements. They only save recomputations when
+# elements are accessed more than once, so on single use traces (fx the
+# interleaved ones) their curve is flat and they are skipped.
+ELEMENT_POLICIES = {'lru', 'fifo', 'min'}
+
+
+# Whether every element of the trace is accessed only once
+def single_use(data):
+    return len(set(data)) == len(data)
+
+
+# Curve of a policy, None if the policy is skipped for the trace
+def policy_curve(policy, data, cache_sizes, l):
+    if policy in ELEMENT_POLICIES and single_use(data):
+        return None
+    return POLICIES[policy](data, cache_sizes, l)
+
+
+# Smallest cache size with at most target recomputations, or None
+def minimal_cache_size(curve, cache_sizes, target):
+    if curve is None:
+        return None
+    for c, r in zip(cache_sizes, curve):
+        if r is not None and r <= target:
+            return c
+    return None
+
+
+def policy_curves(trace, policies, min_oles=MIN_OLES):
+    l, lamb = PARAMETERS[trace_variant(trace)]
+    data = load_trace(trace)
+    sizes = curve_cache_sizes(min_oles, l, lamb)
+    return sizes, {p: policy_curve(p, data, sizes, l) for p in policies}
+
+
+# Skipped policies are left out
+def write_curves(path, sizes, curves):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    names = [n for n in curves if curves[n] is not None]
+    with open(path, 'w') as file:
+        file.write(','.join(['cache_size'] + names) + '\n')
+        for i, c in enumerate(sizes):
+            values = ['' if curves[n][i] is None else str(curves[n][i]) for n in names]
+            file.write(','.join([str(c)] + values) + '\n')
+
+
+# Curves are written to <out_dir>/<trace folder>/policies-<trace name>.csv
+def curves_path(trace, out_dir=RECOMP_PATH):
+    folder = os.path.dirname(os.path.abspath(trace))
+    out_dir = os.path.join(out_dir, os.path.basename(folder))
+    name, _ = os.path.splitext(os.path.basename(trace))
+    return os.path.join(out_dir, f'policies-{name}.csv')
+
+
+def run_trace(trace, policies, out_dir, min_oles, target):
+    sizes, curves = policy_curves(trace, policies, min_oles)
+    path = curves_path(trace, out_dir)
+    write_curves(path, sizes, curves)
+    minimal = {}
+    if target is not None:
+        minimal = {p: minimal_cache_size(curves[p], sizes, target) for p in policies}
+    skipped = [p for p in policies if curves[p] is None]
+    return path, minimal, skipped
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compare cache replacement policies on access traces.')
+
+    parser.add_argument('traces', nargs='+', help='Trace files')
+    parser.add_argument('-p', '--policies', nargs='+', default=list(POLICIES),
+                        choices=list(POLICIES), help='Policies to simulate (default: all)')
+    parser.add_argument('--target', type=int, default=None,
+                        help='Report the minimal cache size with at most this many recomputations')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='Process count. Set to 0 for max utilization (default: 1)')
+    parser.add_argument('-o', '--out-dir', default=RECOMP_PATH,
+                        help=f'Output folder (default: {os.path.relpath(RECOMP_PATH)})')
+    parser.add_argument('--min-oles', type=int, default=MIN_OLES,
+                        help=f'Smallest cache size in OLEs (default: {MIN_OLES})')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    threads = args.threads if args.threads > 0 else os.cpu_count()
+    with ProcessPoolExecutor(max_workers=max(1, min(threads, len(args.traces)))) as executor:
+        futures = [executor.submit(run_trace, t, args.policies, args.out_dir, args.min_oles, args.target)
+                   for t in args.traces]
+        results = [f.result() for f in futures]
+
+    for path, _, skipped in results:
+        print(f'Wrote {path}')
+        if skipped:
+            print(f'  skipped {", ".join(skipped)}: every element is accessed once')
+
+    if args.target is not None:
+        print(f'\nMinimal cache size for at most {args.target} recomputations\n')
+        print('| Trace |' + ''.join(f' {p} |' for p in args.policies))
+        print('|:------|' + ''.join(f' {len(p) * "-"}:|' for p in args.policies))
+        for trace, (_, minimal, skipped) in zip(args.traces, results):
+            cells = ''.join(f' {"skipped" if p in skipped else "-" if minimal[p] is None else minimal[p]} |'
+                            for p in args.policies)
+            print(f'| {os.path.basename(trace)} |{cells}')
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# This script keeps every result in a single append-only SQLite store. Each
+# faest_test.py run adds a run with its build configuration and one record
+# per (variant, operation, tool, metric). Saved result folders can be
+# imported, and tables are written from the store instead of the raw files.
+import os
+import sys
+import json
+import math
+import sqlite3
+import socket
+import platform
+import argparse
+import subprocess
+from datetime import datetime, timezone
+
+import parse_massif
+import parse_callgrind
+import parse_perf
+import parse_bench
+import parse_throughput
+import parse_stack
+from parse_scaling import MSG_FOLDER_RE
+from compare_results import detect_tool, split_result_name, TEST_NAMES
+from parse_cache import ParseCache, parse_all
+
+FILEPATH = os.path.dirname(os.path.realpath(__file__))
+STORE_PATH = f'{FILEPATH}/test/results.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    time TEXT NOT NULL,
+    label TEXT,
+    mode TEXT,
+    commit_hash TEXT,
+    host TEXT,
+    compiler TEXT,
+    compiler_flags TEXT,
+    openssl INTEGER,
+    build_config TEXT,
+    args TEXT
+);
+CREATE TABLE IF NOT EXISTS records (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    variant TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    tool TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL NOT NULL,
+    msg_len INTEGER,
+    workers INTEGER
+);
+CREATE INDEX IF NOT EXISTS records_key ON records (variant, operation, tool, metric);
+'''
+
+RUN_COLUMNS = ['time', 'label', 'mode', 'commit_hash', 'host', 'compiler',
+               'compiler_flags', 'openssl', 'build_config', 'args']
+
+SUMMARIZE = {'callgrind': parse_callgrind.summarize_file,
+             'massif': parse_massif.summarize_file,
+             'perf': parse_perf.summarize_file,
+             'bench': parse_bench.summarize_file,
+             'throughput': parse_throughput.summarize_file,
+             'stack': parse_stack.summarize_file}
+
+BENCH_METRICS = ['iterations', 'median_ns', 'median_rel_ci', 'p10_ns', 'p90_ns', 'p99_ns',
+                 'ops_per_second', 'median_cycles', 'median_instructions']
+
+# Metric used when a single one is shown per tool
+MAIN_METRICS = {'callgrind': 'Ir',
+                'massif': 'peak',
+                'perf': 'cycles',
+                'bench': 'median_ns',
+                'throughput': 'ops_per_second',
+                'stack': 'peak_stack',
+                'pqm4': 'cycles'}
+
+# Build options worth keeping from meson-info/intro-buildoptions.json
+MESON_OPTIONS = ['buildtype', 'optimization', 'debug', 'b_ndebug', 'b_lto', 'c_args', 'c_link_args']
+
+
+def open_store(path=STORE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def git_commit(path):
+    try:
+        process = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=path, capture_output=True, text=True)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return process.stdout.strip() if process.returncode == 0 else None
+
+
+def compiler_version(compiler):
+    try:
+        process = subprocess.run([compiler, '--version'], capture_output=True, text=True)
+    except FileNotFoundError:
+        return compiler
+    lines = process.stdout.splitlines()
+    return lines[0] if process.returncode == 0 and lines else compiler
+
+
+def host_info():
+    cpu = platform.processor()
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    cpu = line.split(':', 1)[1].strip()
+                    break
+    except FileNotFoundError:
+        pass
+    return f'{socket.gethostname()} ({platform.system()} {platform.machine()}, {cpu})'
+
+
+# Selected meson options of a configured build folder, empty if unknown
+def meson_options(build_path):
+    try:
+        with open(f'{build_path}/meson-info/intro-buildoptions.json', 'r') as f:
+            options = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return {o['name']: o['value'] for o in options if o['name'] in MESON_OPTIONS}
+
+
+# C flags implied by the meson options
+def meson_flags(options):
+    flags = []
+    if options.get('optimization', 'plain') != 'plain':
+        flags.append(f'-O{options["optimization"]}')
+    if options.get('debug'):
+        flags.append('-g')
+    if options.get('b_ndebug') in (True, 'true'):
+        flags.append('-DNDEBUG')
+    flags += options.get('c_args', [])
+    return ' '.join(flags)
+
+
+def add_run(conn, run):
+    run = dict(run)
+    run.setdefault('time', datetime.now(timezone.utc).isoformat(timespec='seconds'))
+    for key in ('build_config', 'args'):
+        if isinstance(run.get(key), dict):
+            run[key] = json.dumps(run[key], sort_keys=True)
+    cursor = conn.execute(f'INSERT INTO runs ({", ".join(RUN_COLUMNS)}) VALUES ({", ".join("?" * len(RUN_COLUMNS))})',
+                          [run.get(c) for c in RUN_COLUMNS])
+    return cursor.lastrowid
+
+
+def add_records(conn, run_id, records):
+    conn.executemany('INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                     [(run_id, *r) for r in records])
+    conn.commit()
+
+
+def result_tool(path):
+    element = os.path.basename(path)
+    if element.startswith('bench_'):
+        return 'bench'
+    if element.startswith('throughput_'):
+        return 'throughput'
+    if element.startswith('stack_'):
+        return 'stack'
+    if split_result_name(path) is None:
+        return None
+    return detect_tool(path)
+
+
+# (metric, value) pairs of a summary
+def metrics(tool, summary):
+    if tool == 'callgrind':
+        return list(zip(summary['events'], summary['totals']))
+    if tool == 'massif':
+        return [(m, summary[m]) for m in ('peak', 'peak_heap', 'peak_stack')]
+    if tool == 'perf':
+        values = [(n, c['value']) for n, c in summary['counters'].items()]
+        values += [('elapsed', summary['elapsed']), ('ipc', summary['ipc'])]
+        if summary['elapsed']:
+            ci = parse_perf.confidence_interval(summary['elapsed_stddev'], summary['runs'])
+            values.append(('elapsed_rel_ci', ci / summary['elapsed'] if math.isfinite(ci) else None))
+        return values
+    if tool == 'bench':
+        return [(m, summary[m]) for m in BENCH_METRICS]
+    if tool == 'stack':
+        return [('peak_stack', summary['peak_stack'])]
+    return [('ops_per_second', summary['ops_per_second'])]
+
+
+# Records (variant, operation, tool, metric, value, msg_len, workers) of the
+# result files below dir_path, or only those directly in it
+def collect_records(dir_path, threads=1, cache=None, recursive=True):
+    paths = {tool: [] for tool in SUMMARIZE}
+    for root, dirs, files in os.walk(dir_path):
+        dirs.sort()
+        if not recursive:
+            dirs.clear()
+        for element in sorted(files):
+            path = os.path.join(root, element)
+            tool = result_tool(path)
+            if tool is not None:
+                paths[tool].append(path)
+
+    records = []
+    for tool, tool_paths in paths.items():
+        for path, s in zip(tool_paths, parse_all(tool_paths, SUMMARIZE[tool], threads, cache)):
+            name = split_result_name(s['name'] if tool in ('bench', 'throughput', 'stack') else path)
+            if name is None:
+                continue
+            # Scaling results are in msg-<n>/<tool>/
+            match = MSG_FOLDER_RE.match(os.path.basename(os.path.dirname(os.path.dirname(path))))
+            msg_len = int(match.group(1)) if match else None
+            for metric, value in metrics(tool, s):
+                if value is not None:
+                    records.append((*name, tool, metric, value, msg_len, s.get('workers')))
+    return records
+
+
+def store_run(run, records, path=STORE_PATH):
+    conn = open_store(path)
+    run_id = add_run(conn, run)
+    add_records(conn, run_id, records)
+    conn.close()
+    return run_id
+
+
+# Store the results below dir_path as a new run. Returns its id, or None if
+# there were no results.
+def record_run(dir_path, run, threads=1, cache=None, path=STORE_PATH):
+    records = collect_records(dir_path, threads, cache)
+    if not records:
+        return None
+    return store_run(run, records, path)
+
+
+# Import every folder below dir_path that holds result files as its own run,
+# labelled with its path. OpenSSL is guessed from the folder name.
+def import_folder(dir_path, threads=1, cache=None, path=STORE_PATH):
+    imported = []
+    parent = os.path.dirname(os.path.abspath(dir_path))
+    for root, dirs, _ in os.walk(dir_path):
+        dirs.sort()
+        records = collect_records(root, threads, cache, recursive=False)
+        if not records:
+            continue
+        label = os.path.relpath(os.path.abspath(root), parent)
+        lower = label.lower()
+        openssl = 0 if 'noopenssl' in lower else 1 if 'openssl' in lower else None
+        run_id = store_run({'label': label, 'mode': 'import', 'openssl': openssl}, records, path)
+        imported.append((run_id, label, len(records)))
+    return imported
+
+
+def latest_run(conn, mode=None):
+    if mode is None:
+        row = conn.execute('SELECT max(id) FROM runs').fetchone()
+    else:
+        row = conn.execute('SELECT max(id) FROM runs WHERE mode = ?', (mode,)).fetchone()
+    return row[0]
+
+
+# Summaries of a run and tool in the layout of the parser's summarize_file,
+# with only the stored metrics filled in
+def summaries(conn, run_id, tool, keys=()):
+    result = {}
+    rows = conn.execute('SELECT variant, operation, metric, value FROM records'
+                        ' WHERE run_id = ? AND tool = ? AND msg_len IS NULL AND workers IS NULL',
+                        (run_id, tool))
+    for variant, operation, metric, value in rows:
+        name = f'{variant}_{operation}'
+        summary = result.setdefault(name, {'name': name, **dict.fromkeys(keys)})
+        summary[metric] = value
+    return list(result.values())
+
+
+def run_name(conn, run_id):
+    label, time = conn.execute('SELECT label, time FROM runs WHERE id = ?', (run_id,)).fetchone()
+    return label or f'#{run_id} {time}'
+
+
+def sort_key(key):
+    variant, operation = key
+    op = TEST_NAMES.index(operation) if operation in TEST_NAMES else len(TEST_NAMES)
+    return (variant[-1], variant[:-1], op)
+
+
+# One row per variant and operation, one column per run
+def write_markdown_table(conn, run_ids, tool, metric, wf):
+    values = {}
+    for run_id in run_ids:
+        rows = conn.execute('SELECT variant, operation, value FROM records WHERE run_id = ? AND tool = ?'
+                            ' AND metric = ? AND msg_len IS NULL AND workers IS NULL',
+                            (run_id, tool, metric))
+        for variant, operation, value in rows:
+            values.setdefault((variant, operation), {})[run_id] = value
+
+    wf.write('| Variant | Operation |' + ''.join(f' {run_name(conn, r)} |' for r in run_ids) + '\n')
+    wf.write('|:-------:|:---------:|' + '-----:|' * len(run_ids) + '\n')
+    for key in sorted(values, key=sort_key):
+        cells = (values[key].get(r) for r in run_ids)
+        wf.write(f'| {key[0]} | {key[1]} |' + ''.join(' - |' if v is None else f' {v:,.0f} |' for v in cells) + '\n')
+
+
+def write_runs(conn, wf):
+    wf.write('| Run | Time | Label | Mode | OpenSSL | Compiler flags | Commit |\n')
+    wf.write('|----:|:-----|:------|:-----|:-------:|:---------------|:-------|\n')
+    rows = conn.execute('SELECT id, time, label, mode, openssl, compiler_flags, commit_hash FROM runs ORDER BY id')
+    for run_id, time, label, mode, openssl, flags, commit in rows:
+        openssl = '-' if openssl is None else 'yes' if openssl else 'no'
+        wf.write(f'| {run_id} | {time} | {label or "-"} | {mode or "-"} | {openssl} |'
+                 f' {flags or "-"} | {(commit or "-")[:10]} |\n')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Append-only results store.')
+    parser.add_argument('--store', default=STORE_PATH,
+                        help=f'SQLite store (default: {os.path.relpath(STORE_PATH)})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    imp = commands.add_parser('import', help='Import result folders, one run per folder holding results')
+    imp.add_argument('folders', nargs='+')
+    imp.add_argument('-t', '--threads', type=int, default=1,
+                     help='Process count. Set to 0 for max utilization (default: 1)')
+    imp.add_argument('--no-cache', action='store_true', default=False,
+                     help='Do not use the parse cache')
+
+    commands.add_parser('runs', help='List the stored runs')
+
+    table = commands.add_parser('table', help='Markdown table of a metric, one column per run')
+    table.add_argument('tool', choices=list(MAIN_METRICS))
+    table.add_argument('metric', help='Metric, fx Ir, peak, cycles, median_ns or stack')
+    table.add_argument('-r', '--runs', type=int, nargs='+', default=None,
+                       help='Run ids (default: latest run)')
+    table.add_argument('-o', '--output', default=None,
+                       help='Write markdown table to file instead of stdout')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.command == 'import':
+        cache = None if args.no_cache else ParseCache()
+        threads = args.threads if args.threads > 0 else os.cpu_count()
+        for folder in args.folders:
+            for run_id, label, count in import_folder(folder, threads, cache, args.store):
+                print(f'Run {run_id}: {label} ({count} records)')
+        if cache is not None:
+            cache.save()
+        exit(0)
+
+    conn = open_store(args.store)
+    if args.command == 'runs':
+        write_runs(conn, sys.stdout)
+        exit(0)
+
+    run_ids = args.runs or [latest_run(conn)]
+    known = {row[0] for row in conn.execute('SELECT id FROM runs')}
+    missing = [r for r in run_ids if r not in known]
+    if missing:
+        print(f'Unknown run(s): {missing}', file=sys.stderr)
+        exit(1)
+    if args.output:
+        with open(args.output, 'w') as wf:
+            write_markdown_table(conn, run_ids, args.tool, args.metric, wf)
+    else:
+        write_markdown_table(conn, run_ids, args.tool, args.metric, sys.stdout)
+    exit(0)
@@ -0,0 +1,5 @@
+# The scripts live in the repository root and are imported as top level modules
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
@@ -0,0 +1,268 @@
+#include <time.h>
+#include <stdint.h>
+#include "faest_test.h"
+
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#define HAVE_RDTSC
+#endif
+
+#ifdef __linux__
+#include <unistd.h>
+#include <sys/syscall.h>
+#include <linux/perf_event.h>
+#endif
+
+// Usage: bench <keygen|sign|verify> <iterations> <warmup> <message length> [corpus size]
+// Prints one line per iteration with nanoseconds, cycles and retired
+// instructions. Cycles and instructions are -1 if not available.
+//
+// sign stores its keys and last signature in CRYPTO_ALGNAME "_bench", and
+// verify reuses them if the message length matches, so that a profiled
+// verify run does not include signing.
+//
+// With a corpus size, keys and messages (and signatures for verify) are
+// generated for that many entries and the operation loops over them. After
+// the warm-up the harness prints "ready" and waits for a line on stdin, so
+// that several workers can be started at the same time. It then prints a
+// single line with the start and end of the timed loop (CLOCK_MONOTONIC
+// nanoseconds) and the number of operations.
+
+static uint64_t now_ns(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (uint64_t)ts.tv_sec * 1000000000ULL + (uint64_t)ts.tv_nsec;
+}
+
+static int64_t now_cycles(void) {
+#ifdef HAVE_RDTSC
+    return __rdtsc();
+#else
+    return -1;
+#endif
+}
+
+// User space instruction counter of this process, -1 if not available
+static int open_instructions(void) {
+#ifdef __linux__
+    struct perf_event_attr attr;
+    memset(&attr, 0, sizeof(attr));
+    attr.type = PERF_TYPE_HARDWARE;
+    attr.size = sizeof(attr);
+    attr.config = PERF_COUNT_HW_INSTRUCTIONS;
+    attr.exclude_kernel = 1;
+    attr.exclude_hv = 1;
+    return (int)syscall(SYS_perf_event_open, &attr, 0, -1, -1, 0);
+#else
+    return -1;
+#endif
+}
+
+static int64_t read_instructions(int fd) {
+#ifdef __linux__
+    uint64_t count;
+    if (fd >= 0 && read(fd, &count, sizeof(count)) == sizeof(count))
+        return (int64_t)count;
+#endif
+    (void)fd;
+    return -1;
+}
+
+typedef struct {
+    unsigned char pk[CRYPTO_PUBLICKEYBYTES];
+    unsigned char sk[CRYPTO_SECRETKEYBYTES];
+    unsigned char *m;
+    unsigned long long mlen;
+    unsigned char *sm;
+    unsigned long long smlen;
+    unsigned char *open_m;
+} bench_state;
+
+static int run_keygen(bench_state *s) {
+    return crypto_sign_keypair(s->pk, s->sk);
+}
+
+static int run_sign(bench_state *s) {
+    return crypto_sign(s->sm, &s->smlen, s->m, s->mlen, s->sk);
+}
+
+static int run_verify(bench_state *s) {
+    unsigned long long open_mlen;
+    return crypto_sign_open(s->open_m, &open_mlen, s->sm, s->smlen, s->pk);
+}
+
+static int write_bench_state(const bench_state *s) {
+    FILE *file = fopen(CRYPTO_ALGNAME "_bench", "wb");
+    if (file == NULL)
+        return 1;
+
+    if (fwrite(s->pk, 1, CRYPTO_PUBLICKEYBYTES, file) != CRYPTO_PUBLICKEYBYTES ||
+        fwrite(s->sk, 1, CRYPTO_SECRETKEYBYTES, file) != CRYPTO_SECRETKEYBYTES ||
+        fwrite(&s->mlen, sizeof(s->mlen), 1, file) != 1 ||
+        fwrite(&s->smlen, sizeof(s->smlen), 1, file) != 1 ||
+        fwrite(s->sm, 1, s->smlen, file) != s->smlen) {
+        fclose(file);
+        return 1;
+    }
+    return fclose(file);
+}
+
+// Returns 0 if keys and a signature of the same message length were read
+static int read_bench_state(bench_state *s) {
+    FILE *file = fopen(CRYPTO_ALGNAME "_bench", "rb");
+    if (file == NULL)
+        return 1;
+
+    unsigned long long mlen;
+    if (fread(s->pk, 1, CRYPTO_PUBLICKEYBYTES, file) != CRYPTO_PUBLICKEYBYTES ||
+        fread(s->sk, 1, CRYPTO_SECRETKEYBYTES, file) != CRYPTO_SECRETKEYBYTES ||
+        fread(&mlen, sizeof(mlen), 1, file) != 1 || mlen != s->mlen ||
+        fread(&s->smlen, sizeof(s->smlen), 1, file) != 1 ||
+        s->smlen != CRYPTO_BYTES + s->mlen ||
+        fread(s->sm, 1, s->smlen, file) != s->smlen) {
+        fclose(file);
+        return 1;
+    }
+    return fclose(file);
+}
+
+static int run_corpus(int (*op)(bench_state *), long iterations, long warmup,
+                      unsigned long long mlen, long corpus) {
+    bench_state *states = malloc(sizeof(bench_state) * corpus);
+    if (states == NULL)
+        return 1;
+
+    for (long i = 0; i < corpus; i++) {
+        bench_state *s = &states[i];
+        s->mlen = mlen;
+        s->m = malloc(mlen + 1);
+        s->sm = malloc(CRYPTO_BYTES + mlen);
+        s->open_m = malloc(mlen + 1);
+        if (s->m == NULL || s->sm == NULL || s->open_m == NULL)
+            return 1;
+
+        for (unsigned long long j = 0; j < mlen; j++)
+            s->m[j] = (unsigned char)(i + j);
+        if (crypto_sign_keypair(s->pk, s->sk) ||
+            (op == run_verify && crypto_sign(s->sm, &s->smlen, s->m, s->mlen, s->sk)))
+            return 1;
+    }
+
+    for (long i = 0; i < warmup; i++) {
+        if (op(&states[i % corpus]))
+            return 1;
+    }
+
+    // Start barrier
+    printf("ready\n");
+    fflush(stdout);
+    char line[16];
+    if (fgets(line, sizeof(line), stdin) == NULL)
+        return 1;
+
+    uint64_t start_ns = now_ns();
+    for (long i = 0; i < iterations; i++) {
+        if (op(&states[i % corpus]))
+            return 1;
+    }
+    uint64_t end_ns = now_ns();
+    printf("%llu %llu %ld\n", (unsigned long long)start_ns, (unsigned long long)end_ns, iterations);
+
+    for (long i = 0; i < corpus; i++) {
+        free(states[i].m);
+        free(states[i].sm);
+        free(states[i].open_m);
+    }
+    free(states);
+    return 0;
+}
+
+int main(int argc, char *argv[]) {
+    if (argc != 5 && argc != 6) {
+        fprintf(stderr, "Usage: %s <keygen|sign|verify> <iterations> <warmup> <message length> [corpus size]\n", argv[0]);
+        return 1;
+    }
+
+    int (*op)(bench_state *);
+    if (strcmp(argv[1], "keygen") == 0)
+        op = run_keygen;
+    else if (strcmp(argv[1], "sign") == 0)
+        op = run_sign;
+    else if (strcmp(argv[1], "verify") == 0)
+        op = run_verify;
+    else {
+        fprintf(stderr, "Unknown operation %s\n", argv[1]);
+        return 1;
+    }
+
+    long iterations = atol(argv[2]);
+    long warmup = atol(argv[3]);
+    bench_state s;
+    s.mlen = strtoull(argv[4], NULL, 10);
+
+    if (argc == 6) {
+        long corpus = atol(argv[5]);
+        if (corpus <= 0)
+            return 1;
+        return run_corpus(op, iterations, warmup, s.mlen, corpus);
+    }
+
+    s.m = malloc(s.mlen + 1);
+    s.sm = malloc(CRYPTO_BYTES + s.mlen);
+    s.open_m = malloc(s.mlen + 1);
+    uint64_t *ns = malloc(sizeof(uint64_t) * (iterations + 1));
+    int64_t *cycles = malloc(sizeof(int64_t) * (iterations + 1));
+    int64_t *instructions = malloc(sizeof(int64_t) * (iterations + 1));
+    if (s.m == NULL || s.sm == NULL || s.open_m == NULL || ns == NULL || cycles == NULL ||
+        instructions == NULL)
+        return 1;
+
+    for (unsigned long long i = 0; i < s.mlen; i++)
+        s.m[i] = (unsigned char)i;
+
+    // Keys for sign, keys and signature for verify
+    if (op == run_sign && crypto_sign_keypair(s.pk, s.sk))
+        return 1;
+    if (op == run_verify && read_bench_state(&s) &&
+        (crypto_sign_keypair(s.pk, s.sk) || crypto_sign(s.sm, &s.smlen, s.m, s.mlen, s.sk)))
+        return 1;
+
+    int counter = open_instructions();
+
+    for (long i = 0; i < warmup; i++) {
+        if (op(&s))
+            return 1;
+    }
+
+    for (long i = 0; i < iterations; i++) {
+        int64_t start_instructions = read_instructions(counter);
+        uint64_t start_ns = now_ns();
+        int64_t start_cycles = now_cycles();
+        if (op(&s))
+            return 1;
+        int64_t end_cycles = now_cycles();
+        ns[i] = now_ns() - start_ns;
+        int64_t end_instructions = read_instructions(counter);
+        cycles[i] = start_cycles < 0 ? -1 : end_cycles - start_cycles;
+        instructions[i] = start_instructions < 0 ? -1 : end_instructions - start_instructions;
+    }
+
+    if (op == run_sign && iterations + warmup > 0 && write_bench_state(&s))
+        return 1;
+
+    for (long i = 0; i < iterations; i++)
+        printf("%llu %lld %lld\n", (unsigned long long)ns[i], (long long)cycles[i],
+               (long long)instructions[i]);
+
+    free(s.m);
+    free(s.sm);
+    free(s.open_m);
+    free(ns);
+    free(cycles);
+    free(instructions);
+#ifdef __linux__
+    if (counter >= 0)
+        close(counter);
+#endif
+    return 0;
+}
@@ -0,0 +1,142 @@
+#include <stdint.h>
+#include <pthread.h>
+#include "faest_test.h"
+
+// Usage: stack <keygen|sign|verify> [plain]
+// Runs the operation like the test programs (keys and signature are passed
+// through the same files) on a thread with a painted stack, and prints the
+// peak stack usage of the operation in bytes.
+//
+// The stack is filled with a canary before the thread starts, and afterwards
+// the deepest overwritten word is the high-water mark. The usage of a thread
+// that does nothing (thread start, TLS at the top of the stack) is measured
+// the same way and subtracted. Buffers on the stack that are never written
+// are not counted.
+//
+// With plain the operation runs on the main thread without painting, to be
+// profiled by massif for comparison.
+
+#ifndef STACK_SIZE
+#define STACK_SIZE (16 * 1024 * 1024)
+#endif
+
+#define CANARY 0xa5a5a5a5a5a5a5a5ULL
+
+typedef int (*operation)(void);
+
+typedef struct {
+    operation op;
+    int ret;
+} thread_arg;
+
+static int run_nothing(void) {
+    return 0;
+}
+
+static int run_keygen(void) {
+    unsigned char pk[CRYPTO_PUBLICKEYBYTES];
+    unsigned char sk[CRYPTO_SECRETKEYBYTES];
+    if (crypto_sign_keypair(pk, sk) == -1)
+        return 1;
+
+    return write_pk(pk) || write_sk(sk);
+}
+
+static int run_sign(void) {
+    unsigned char sk[CRYPTO_SECRETKEYBYTES];
+    if (read_sk(sk) == 1)
+        return 1;
+
+    unsigned char sm[CRYPTO_BYTES + MSG_LEN];
+    unsigned long long smlen;
+    if (crypto_sign(sm, &smlen, (const unsigned char *)MSG, MSG_LEN, sk) == -1)
+        return 1;
+
+    return write_signature(sm);
+}
+
+static int run_verify(void) {
+    unsigned char pk[CRYPTO_PUBLICKEYBYTES];
+    if (read_pk(pk) == 1)
+        return 1;
+
+    unsigned char sm[CRYPTO_BYTES + MSG_LEN];
+    if (read_signature(sm) == 1)
+        return 1;
+
+    unsigned char open_m[MSG_LEN];
+    unsigned long long open_mlen;
+    if (crypto_sign_open(open_m, &open_mlen, sm, CRYPTO_BYTES + MSG_LEN, pk) == -1)
+        return 1;
+
+    return 0;
+}
+
+static void *run_thread(void *arg) {
+    thread_arg *t = arg;
+    t->ret = t->op();
+    return NULL;
+}
+
+// Bytes of the painted stack used by op, -1 on failure. The stack grows down,
+// so the untouched canary words are at the start of the buffer.
+static long painted_usage(operation op, uint64_t *stack, int *ret) {
+    const size_t words = STACK_SIZE / sizeof(uint64_t);
+    for (size_t i = 0; i < words; i++)
+        stack[i] = CANARY;
+
+    pthread_attr_t attr;
+    pthread_t thread;
+    thread_arg t = {op, 1};
+    if (pthread_attr_init(&attr) != 0 || pthread_attr_setstack(&attr, stack, STACK_SIZE) != 0 ||
+        pthread_create(&thread, &attr, run_thread, &t) != 0)
+        return -1;
+    pthread_join(thread, NULL);
+    pthread_attr_destroy(&attr);
+    *ret = t.ret;
+
+    size_t untouched = 0;
+    while (untouched < words && stack[untouched] == CANARY)
+        untouched++;
+    if (untouched == 0) {
+        fprintf(stderr, "Stack overflow, increase STACK_SIZE (%d bytes)\n", STACK_SIZE);
+        return -1;
+    }
+    return (long)((words - untouched) * sizeof(uint64_t));
+}
+
+int main(int argc, char *argv[]) {
+    if (argc != 2 && !(argc == 3 && strcmp(argv[2], "plain") == 0)) {
+        fprintf(stderr, "Usage: %s <keygen|sign|verify> [plain]\n", argv[0]);
+        return 1;
+    }
+
+    operation op;
+    if (strcmp(argv[1], "keygen") == 0)
+        op = run_keygen;
+    else if (strcmp(argv[1], "sign") == 0)
+        op = run_sign;
+    else if (strcmp(argv[1], "verify") == 0)
+        op = run_verify;
+    else {
+        fprintf(stderr, "Unknown operation %s\n", argv[1]);
+        return 1;
+    }
+
+    if (argc == 3)
+        return op();
+
+    uint64_t *stack = aligned_alloc(4096, STACK_SIZE);
+    if (stack == NULL)
+        return 1;
+
+    int ret;
+    long base = painted_usage(run_nothing, stack, &ret);
+    long used = base < 0 ? -1 : painted_usage(op, stack, &ret);
+    free(stack);
+    if (used < 0 || ret != 0)
+        return 1;
+
+    printf("%ld\n", used - base);
+    return 0;
+}
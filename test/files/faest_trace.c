@@ -0,0 +1,83 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+
+// Access trace writer, linked into the test programs in trace mode
+// (faest_test.py --trace). FAEST is then built with -DFAEST_TRACE_ACCESS,
+// where the VBB code calls
+//
+//     void faest_trace_access(unsigned int index);
+//
+// with every OLE/VOLE index it accesses. The programs are linked with
+// -rdynamic so the library resolves the symbol against them.
+//
+// The indices are written to $FAEST_TRACE_FILE when the program exits:
+// "FTRC", the index width in bytes (2 if all indices fit, otherwise 4), three
+// zero bytes, and then the indices in little endian. Nothing is written if
+// there were no accesses.
+
+#define TRACE_INITIAL_CAPACITY 4096
+
+static uint32_t* trace;
+static size_t trace_len;
+static size_t trace_cap;
+static uint32_t trace_max;
+static int trace_failed;
+
+static void write_trace(void) {
+    const char* path = getenv("FAEST_TRACE_FILE");
+    if (path == NULL || trace_len == 0)
+        return;
+    if (trace_failed) {
+        fprintf(stderr, "Out of memory while tracing, %s not written\n", path);
+        return;
+    }
+
+    FILE* f = fopen(path, "wb");
+    if (f == NULL) {
+        fprintf(stderr, "Could not open %s\n", path);
+        return;
+    }
+
+    const unsigned char width = trace_max > UINT16_MAX ? 4 : 2;
+    const unsigned char header[8] = {'F', 'T', 'R', 'C', width, 0, 0, 0};
+    fwrite(header, 1, sizeof(header), f);
+
+    unsigned char buffer[4096];
+    size_t n = 0;
+    for (size_t i = 0; i < trace_len; i++) {
+        for (unsigned char b = 0; b < width; b++)
+            buffer[n++] = (trace[i] >> (8 * b)) & 0xff;
+        if (n + width > sizeof(buffer)) {
+            fwrite(buffer, 1, n, f);
+            n = 0;
+        }
+    }
+    fwrite(buffer, 1, n, f);
+
+    if (fclose(f) != 0)
+        fprintf(stderr, "Could not write %s\n", path);
+    free(trace);
+}
+
+void faest_trace_access(unsigned int index) {
+    if (trace_failed)
+        return;
+
+    if (trace_len == trace_cap) {
+        if (trace_cap == 0)
+            atexit(write_trace);
+        size_t cap = trace_cap ? 2 * trace_cap : TRACE_INITIAL_CAPACITY;
+        uint32_t* grown = realloc(trace, cap * sizeof(*trace));
+        if (grown == NULL) {
+            trace_failed = 1;
+            return;
+        }
+        trace = grown;
+        trace_cap = cap;
+    }
+
+    trace[trace_len++] = index;
+    if (index > trace_max)
+        trace_max = index;
+}
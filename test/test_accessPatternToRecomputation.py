@@ -0,0 +1,19 @@
+import pytest
+
+import accessPatternToRecomputation as recomp
+
+
+def test_saved_curves():
+    assert recomp.check_saved_curves()
+
+
+# The jumping curve computation against the reference loop over every access
+@pytest.mark.parametrize('trace', ['interleaved/em128-sign.txt', 'VBB-Prove/EM128F.txt'])
+def test_curve_matches_reference(trace):
+    data = recomp.load_file_into_array(trace)
+    l, lamb = recomp.PARAMETERS[recomp.trace_variant(trace)]
+    largest = recomp.find_largest(data)
+    sizes = list(recomp.curve_cache_sizes(recomp.MIN_OLES, l, lamb))[::37]
+
+    expected = [recomp.compute_recomputation(data, c, largest, l) for c in sizes]
+    assert recomp.compute_recomputation_curve(data, sizes, l) == expected
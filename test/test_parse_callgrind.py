@@ -0,0 +1,85 @@
+import parse_callgrind
+
+# main in main.c calls helper (inlined from helper.h) and helper calls square
+# in the same header without cfi, so square is in helper.h and not main.c
+INLINED = '''# callgrind format
+version: 1
+positions: line
+events: Ir
+
+fl=(1) main.c
+fn=(1) main
+1 10
+fi=(2) helper.h
+cfn=(2) square
+calls=3 5
+2 30
+fe=(1)
+3 5
+cfi=(1)
+cfn=(1)
+calls=1 1
+4 7
+
+fl=(2)
+fn=(2)
+5 10
+
+totals: 52
+'''
+
+
+def test_callee_defaults_to_inlined_file(tmp_path):
+    path = tmp_path / 'main_sign'
+    path.write_text(INLINED)
+    profile = parse_callgrind.parse_file(str(path))
+
+    assert set(profile.functions) == {('main.c', 'main'), ('helper.h', 'square')}
+    square = profile.functions[('helper.h', 'square')]
+    assert square.calls == 3
+    assert square.exclusive == 10
+
+    main = profile.functions[('main.c', 'main')]
+    assert main.calls == 1
+    assert main.exclusive == 15
+    # The recursive call is not added to the inclusive cost
+    assert main.inclusive == 15 + 30
+
+
+# The cfi of the first call does not carry over to the second, so libc's
+# memset is called from main.c and main calls itself in main.c
+CFI_RESET = '''# callgrind format
+version: 1
+positions: line
+events: Ir
+
+fl=(1) main.c
+fn=(1) main
+1 10
+cfi=(2) memset.S
+cfn=(2) memset
+calls=1 5
+2 20
+cfn=(1)
+calls=1 1
+3 40
+
+fl=(2)
+fn=(2)
+5 20
+
+totals: 70
+'''
+
+
+def test_cfi_only_applies_to_its_call(tmp_path):
+    path = tmp_path / 'main_keygen'
+    path.write_text(CFI_RESET)
+    profile = parse_callgrind.parse_file(str(path))
+
+    assert set(profile.functions) == {('main.c', 'main'), ('memset.S', 'memset')}
+    main = profile.functions[('main.c', 'main')]
+    assert main.calls == 1
+    # The recursive call is not added to the inclusive cost
+    assert main.inclusive == 10 + 20
+    assert profile.functions[('memset.S', 'memset')].calls == 1
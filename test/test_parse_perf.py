@@ -0,0 +1,21 @@
+import pytest
+
+import parse_perf
+
+
+@pytest.mark.parametrize('line, decimal', [
+    ('        835.143 msec task-clock', '.'),
+    ('        835,143 msec task-clock', ','),
+    ('      1,234.56 msec task-clock', '.'),
+    ('      1.234,56 msec task-clock', ','),
+    ('       0.837261 +- 0.000404 seconds time elapsed', '.'),
+    ('       0,837261 +- 0,000404 seconds time elapsed', ','),
+])
+def test_detect_decimal(line, decimal):
+    assert parse_perf.detect_decimal([line]) == decimal
+
+
+def test_parse_thousands_grouped():
+    decimal = parse_perf.detect_decimal(['      1.234,56 msec task-clock'])
+    assert parse_perf.parse_number('1.234,56', decimal) == 1234.56
+    assert parse_perf.parse_number('2.345.678', decimal) == 2345678